@@ -1,10 +1,27 @@
 #!/usr/bin/env python3
+import io
 import os
 import re
+import sys
 import csv
+import html
+import hashlib
+import mmap
+import time
+import queue
+import atexit
+import signal
+import string
 import argparse
+import threading
+from functools import lru_cache
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, request, jsonify, send_file, abort, redirect
+import orjson
+from flask import Flask, Response, request, send_file, abort, redirect
+from flask_compress import Compress
+from waitress import serve
 
 """
 Usage:
@@ -20,19 +37,85 @@ Changes from previous versions:
 
 app = Flask(__name__)
 
+# Pages, CSS, JS and SVGs are repetitive text and compress very well
+app.config["COMPRESS_MIN_SIZE"] = 500
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+app.config["COMPRESS_MIMETYPES"] = [
+    "text/html",
+    "text/css",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+]
+# Flask-Compress replaces the ETag of a compressed response, so let it
+# answer If-None-Match itself for the images as well as static files
+app.config["COMPRESS_STREAMING_ENDPOINT_CONDITIONAL"] = ["static", "get_image"]
+# Registered through compress_response below so some responses can opt out
+app.config["COMPRESS_REGISTER"] = False
+compress = Compress(app)
+
+@app.after_request
+def compress_response(response):
+    """
+    Hand responses to Flask-Compress, except X-Sendfile ones (the body is
+    empty and the fronting server sends the file itself, so an encoding
+    header would mislabel it) and 206 partial content (a compressed byte
+    range no longer matches Content-Range).
+    """
+    if response.status_code == 206 or "X-Sendfile" in response.headers:
+        return response
+    return compress.after_request(response)
+
 # Globals
-PAGES = []                # list of all pages: each is (page_html, page_idx)
+SORTED_KEYS = []          # (subject, session, run) of every page, in page order
+DATA_MAP = {}             # (subject, session, run) -> dict with keys: orig, strip, dens, stats
 MASTER_CSV = "QC_data.csv"
 PHASE = "initial"
-FILE_MAP = {}             # int -> absolute filepath (for serving images)
-FILE_ID_COUNTER = 0       # incremental ID for each file in FILE_MAP
+FILE_MAP = {}             # int -> (absolute filepath, mimetype) (for serving images)
+PATH_TO_ID = {}           # absolute filepath -> its ID in FILE_MAP
+FILE_MAP_LOCK = threading.Lock()
+_STATS_CACHE = {}         # abs path of a stats CSV -> (rendered html, mtime)
+
+# QC CSV layout. status/notes are space-padded to a fixed width on write so that
+# most updates rewrite a row in place without touching the rest of the file.
+CSV_FIELDS = ["filename", "status", "notes"]  # rows are handled positionally in this order
+STATUS_WIDTH = 10
+NOTES_WIDTH = 128
+ROWS = {}                 # filename -> [filename, status, notes], loaded once from MASTER_CSV
+ROW_OFFSETS = {}          # filename -> (byte offset, byte length) of its row in MASTER_CSV
+CSV_LOCK = threading.Lock()
+CSV_HAS_HEADER = False    # MASTER_CSV is known to start with the CSV_FIELDS header line
+
+# /qc_update only updates ROWS and enqueues the filename; a background thread
+# coalesces bursts of clicks and persists them in one batch.
+_WRITE_Q = queue.Queue()  # filenames whose row changed
+WRITE_BATCH_SIZE = 100
+WRITE_DEBOUNCE_SEC = 0.2
+
+# One pass over the filename both filters irrelevant files and tells us which
+# slot the file belongs to (via the name of the group that matched).
+CLASSIFY = re.compile(r'(?P<orig>_original_slices\.png)$'
+                      r'|(?P<strip>_skullstripped_slices\.png)$'
+                      r'|(?P<dens>_density\.svg)$'
+                      r'|(?P<stats>_stats\.csv)$'
+                      r'|(?P<nii>T1w\.nii\.gz)$')
+
+# Threads used by the waitress server to handle requests concurrently
+SERVER_THREADS = 8
+
+# Threads used to scan subject directories and prefetch stats (I/O bound)
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# A CSV line made only of numbers, e.g. b"1.5, 2, -3e4, nan, inf"
+_NUMBER = rb'[-+]?(?:\d+\.?\d*(?:e[-+]?\d+)?|\.\d+(?:e[-+]?\d+)?|nan|inf(?:inity)?)'
+NUMERIC_LINE = re.compile(rb'\s*' + _NUMBER + rb'(?:\s*,\s*' + _NUMBER + rb')*\s*$', re.IGNORECASE)
 
 @app.route("/")
 def index():
     """
     Default route: go to the first page if it exists
     """
-    if not PAGES:
+    if not SORTED_KEYS:
         return "<h1>No reports found.</h1>"
     return redirect("/report/0")
 
@@ -41,87 +124,248 @@ def show_report(page_id):
     """
     Show the page with index=page_id
     """
-    if page_id < 0 or page_id >= len(PAGES):
+    if page_id < 0 or page_id >= len(SORTED_KEYS):
         return "<h1>Invalid page index</h1>", 404
-    page_html, _ = PAGES[page_id]
-    return page_html
+    return render_page(page_id)
+
+@app.route("/static.css")
+def static_css():
+    """
+    Stylesheet shared by every report page.
+    """
+    return Response(PAGE_CSS, mimetype="text/css",
+                    headers={"Cache-Control": "public, max-age=31536000"})
+
+@app.route("/app.js")
+def app_js():
+    """
+    JavaScript shared by every report page.
+    """
+    return Response(PAGE_JS, mimetype="application/javascript",
+                    headers={"Cache-Control": "public, max-age=31536000"})
 
 @app.route("/qc_update", methods=["POST"])
 def qc_update():
     """
     AJAX endpoint to update the CSV for a given filename + status + notes
     """
-    data = request.json
+    try:
+        data = orjson.loads(request.get_data(cache=False))
+    except orjson.JSONDecodeError:
+        return json_response({"error": "Invalid JSON body"}, 400)
+    if not isinstance(data, dict):
+        return json_response({"error": "Missing filename or status"}, 400)
     filename = data.get("filename")
     status = data.get("status")
     notes = data.get("notes", "")
     if not filename or not status:
-        return jsonify({"error": "Missing filename or status"}), 400
+        return json_response({"error": "Missing filename or status"}, 400)
+    if not isinstance(filename, str) or not isinstance(status, str) or not isinstance(notes, str):
+        return json_response({"error": "filename, status and notes must be strings"}, 400)
 
-    update_csv(MASTER_CSV, filename, {"status": status, "notes": notes})
-    return jsonify({"message": "QC updated successfully"})
+    set_row(filename, {"status": status, "notes": notes})
+    _WRITE_Q.put(filename)
+    return json_response({"message": "QC updated successfully"})
+
+def json_response(obj, status=200):
+    """
+    Serialize obj with orjson (faster than jsonify's stdlib json).
+    """
+    return app.response_class(orjson.dumps(obj), status=status, mimetype="application/json")
 
 @app.route("/get_image/<int:file_id>")
 def get_image(file_id):
     """
     Serve an image or SVG from the absolute path stored in FILE_MAP.
+    Responses carry an ETag/Last-Modified and a max-age, so flipping back and
+    forth between pages is answered from the browser cache or with a 304.
     """
     if file_id not in FILE_MAP:
         abort(404, "File ID not found")
-    abs_path = FILE_MAP[file_id]
-    if not os.path.exists(abs_path):
+    abs_path, mimetype = FILE_MAP[file_id]
+    try:
+        mtime = os.path.getmtime(abs_path)
+    except OSError:
         abort(404, f"File not found on disk: {abs_path}")
 
-    # We'll guess the mimetype from extension
-    ext = abs_path.lower()
-    if ext.endswith(".png"):
-        mimetype = "image/png"
-    elif ext.endswith(".svg"):
-        mimetype = "image/svg+xml"
-    else:
-        # fallback guess
-        mimetype = "application/octet-stream"
-
-    return send_file(abs_path, mimetype=mimetype)
+    return send_file(abs_path, mimetype=mimetype, conditional=True,
+                     max_age=3600, last_modified=mtime)
 
 
 def update_csv(csv_path, filename, status):
     """
-    Load the CSV, update or append the row, write back.
-    """
-    rows = []
-    found = False
-
-    if os.path.exists(csv_path):
-        with open(csv_path, "r", newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for r in reader:
-                rows.append(r)
-
-    for r in rows:
-        if r["filename"] == filename:
-            r["status"] = status
-            # Update notes only if provided in the status dict
-            if isinstance(status, dict):
-                r["notes"] = status.get("notes", r.get("notes", ""))
-                r["status"] = status["status"]
-            found = True
-            break
-
-    if not found:
-        new_row = {"filename": filename}
+    Update or append the row for filename and write it to csv_path now.
+    """
+    set_row(filename, status)
+    persist_rows(csv_path, [filename])
+
+def set_row(filename, status):
+    """
+    Update the in-memory row for filename. status is either a status string
+    or a dict with "status" and optionally "notes".
+    """
+    with CSV_LOCK:
+        row = ROWS.get(filename)
+        if row is None:
+            row = ROWS[filename] = [filename, "", ""]
+        # Update notes only if provided in the status dict
         if isinstance(status, dict):
-            new_row["status"] = status["status"]
-            new_row["notes"] = status.get("notes", "")
+            row[1] = str(status["status"] or "")
+            row[2] = str(status.get("notes", row[2]) or "")
         else:
-            new_row["status"] = status
-            new_row["notes"] = ""
-        rows.append(new_row)
+            row[1] = str(status or "")
+
+def persist_rows(csv_path, filenames):
+    """
+    Write the current in-memory rows for filenames to the CSV.
+    Existing rows are overwritten in place at the byte offset recorded in
+    ROW_OFFSETS and new rows are appended, so each row costs O(1) I/O.
+    If any row's encoded length changed, the whole file is rewritten once
+    from ROWS instead.
+    """
+    with CSV_LOCK:
+        # Appending to a missing, empty or header-less file would leave the
+        # first row to be read back as the header, so write it out in full
+        if not CSV_HAS_HEADER or not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0:
+            rewrite_csv(csv_path)
+            return
+
+        with open(csv_path, "r+b") as f:
+            for filename in filenames:
+                data = encode_row(ROWS[filename])
+                loc = ROW_OFFSETS.get(filename)
+                if loc is None:
+                    end = f.seek(0, os.SEEK_END)
+                    if end > 0:
+                        f.seek(end - 1)
+                        if f.read(1) != b"\n":
+                            f.write(b"\r\n")
+                            end = f.tell()
+                    f.write(data)
+                    ROW_OFFSETS[filename] = (end, len(data))
+                    continue
+
+                offset, length = loc
+                if len(data) != length:
+                    break
+                f.seek(offset)
+                f.write(data)
+            else:
+                return
+
+        # A row grew or shrank: rewrite everything (which also re-pads every row)
+        rewrite_csv(csv_path)
+
+def writer_loop():
+    """
+    Background thread: wait for an update, collect everything that arrives
+    within WRITE_DEBOUNCE_SEC (up to WRITE_BATCH_SIZE items), and persist
+    each touched row once.
+    """
+    while True:
+        items = [_WRITE_Q.get()]
+        deadline = time.monotonic() + WRITE_DEBOUNCE_SEC
+        while len(items) < WRITE_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                items.append(_WRITE_Q.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        try:
+            persist_rows(MASTER_CSV, dict.fromkeys(items))
+        except Exception as e:
+            print(f"Failed to write QC updates to {MASTER_CSV}: {e}")
+        finally:
+            for _ in items:
+                _WRITE_Q.task_done()
+
+def start_writer():
+    """
+    Start the background CSV writer and make sure queued updates are
+    persisted before the process exits (including on SIGTERM).
+    """
+    threading.Thread(target=writer_loop, name="qc-csv-writer", daemon=True).start()
+    atexit.register(_WRITE_Q.join)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-    with open(csv_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["filename", "status", "notes"])
-        writer.writeheader()
-        writer.writerows(rows)
+def encode_row(row):
+    """
+    Encode a [filename, status, notes] row as CSV bytes with status/notes
+    padded to their fixed widths.
+    """
+    filename, status, notes = row
+    buf = io.StringIO()
+    csv.writer(buf).writerow([filename, str(status or "").ljust(STATUS_WIDTH),
+                              str(notes or "").ljust(NOTES_WIDTH)])
+    return buf.getvalue().encode("utf-8")
+
+def rewrite_csv(csv_path):
+    """
+    Write the whole CSV from ROWS and rebuild ROW_OFFSETS.
+    The rows go to a temporary file next to csv_path which then replaces it,
+    so a failure partway through leaves the previous file intact.
+    """
+    global CSV_HAS_HEADER
+    buf = io.StringIO()
+    csv.writer(buf).writerow(CSV_FIELDS)
+    offsets = {}
+    tmp_path = f"{csv_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(buf.getvalue().encode("utf-8"))
+            for filename, row in ROWS.items():
+                data = encode_row(row)
+                offsets[filename] = (f.tell(), len(data))
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(csv_path):
+            os.chmod(tmp_path, os.stat(csv_path).st_mode & 0o7777)
+        os.replace(tmp_path, csv_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    ROW_OFFSETS.clear()
+    ROW_OFFSETS.update(offsets)
+    CSV_HAS_HEADER = True
+
+def load_csv(csv_path):
+    """
+    Read the CSV once at startup into ROWS, recording the byte offset and
+    length of every row in ROW_OFFSETS.
+    """
+    global CSV_HAS_HEADER
+    ROWS.clear()
+    ROW_OFFSETS.clear()
+    CSV_HAS_HEADER = False
+    if not os.path.exists(csv_path):
+        return
+    with open(csv_path, "rb") as f:
+        consumed = [0]
+
+        def lines():
+            # csv.reader pulls lines lazily, so after each row `consumed`
+            # is exactly the byte offset where that row ends.
+            for raw in f:
+                consumed[0] += len(raw)
+                yield raw.decode("utf-8")
+
+        start = 0
+        for i, row in enumerate(csv.reader(lines())):
+            if i == 0:
+                CSV_HAS_HEADER = bool(row)
+            elif row:
+                # strip the fixed-width padding; short legacy rows get empty fields
+                filename, status, notes = (row + ["", ""])[:3]
+                ROWS[filename] = [filename, status.rstrip(), notes.rstrip()]
+                ROW_OFFSETS[filename] = (start, consumed[0] - start)
+            start = consumed[0]
 
 def main():
     parser = argparse.ArgumentParser(description="Generate HTML QC reports + local server.")
@@ -132,72 +376,148 @@ def main():
                         help="Master CSV file to store QC statuses (default: QC_data.csv).")
     parser.add_argument("--port", default=8080, type=int,
                         help="Port for the local Flask server (default: 8080).")
+    parser.add_argument("--x-sendfile", action="store_true",
+                        help="Send images via the X-Sendfile header so a fronting web server "
+                             "(e.g. Apache with mod_xsendfile) serves them with sendfile().")
     args = parser.parse_args()
 
     global PHASE
     global MASTER_CSV
     PHASE = args.phase
     MASTER_CSV = args.csv
+    # Without a fronting server, waitress's wsgi.file_wrapper streams image
+    # files straight from disk rather than through the Flask response iterator.
+    app.config["USE_X_SENDFILE"] = args.x_sendfile
+    load_csv(MASTER_CSV)
+    start_writer()
 
     print(f"Scanning {args.root_dir} ...")
     generate_in_memory_pages(args.root_dir, phase=PHASE)
-    print(f"Found {len(PAGES)} total pages (subject/session/run combos).")
+    print(f"Found {len(SORTED_KEYS)} total pages (subject/session/run combos).")
 
     print(f"Launching local server on port {args.port}...")
     print(f"Open your browser at http://127.0.0.1:{args.port}")
-    app.run(host="127.0.0.1", port=args.port, debug=False)
+    # waitress is a threaded production WSGI server, so a slow image download
+    # doesn't hold up page loads or QC updates the way the Flask dev server can.
+    serve(app, host="127.0.0.1", port=args.port, threads=SERVER_THREADS)
+
+def iwalk(path):
+    """
+    Recursively yield a DirEntry for every non-directory entry under path.
+    Uses os.scandir directly so the dirent type cached by the OS is reused
+    instead of issuing an extra stat() per entry (as os.walk does).
+    Like os.walk, symlinked directories are not descended into and
+    unreadable directories are skipped.
+    """
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_dir():
+            if not entry.is_symlink():
+                yield from iwalk(entry.path)
+        else:
+            yield entry
+
+def new_slots():
+    """
+    File slots for one (sub, ses, run). 'nii' is never displayed; a NIfTI on
+    its own is enough to give the run a page.
+    """
+    return {"orig": None, "strip": None, "dens": None, "stats": None, "nii": None}
+
+def scan_subtree(path):
+    """
+    Build a partial data_map for every file under path.
+    """
+    data_map = defaultdict(new_slots)
+    add_entries(data_map, iwalk(path))
+    return data_map
+
+def add_entries(data_map, entries):
+    """
+    Classify each DirEntry and record it in data_map under its (sub, ses, run) key.
+    data_map must be a defaultdict(new_slots).
+    """
+    # We'll parse every single file individually
+    for entry in entries:
+        fname = entry.name
+        fullpath = entry.path
+
+        # Check what type of file
+        kind = CLASSIFY.search(fname)
+        if not kind:
+            continue  # skip irrelevant files
+
+        # Attempt to parse sub/ses/run
+        key = parse_bids_key(fname)
+        if key is None:
+            # If we can't parse, skip or store in a "misc" group if you like
+            continue
+
+        # Assign the file path to the correct slot
+        data_map[key][kind.lastgroup] = fullpath
+
+def parse_bids_key(fname):
+    """
+    Parse (subject, session, run) from a name like sub-XXXX[_ses-YYY][_run-ZZZ]_...
+    Session defaults to 'ses-01' and run to ''. Returns None if the name does
+    not start with 'sub-'. BIDS names are rigid enough that splitting on '_'
+    is sufficient; no regex needed.
+    """
+    parts = fname.split('_', 3)
+    subject = parts[0]  # e.g. sub-011228
+    if len(subject) <= 4 or subject[:4].lower() != 'sub-':
+        return None
+    session = 'ses-01'
+    run = ''            # e.g. run-001
+    i = 1
+    if i < len(parts) and len(parts[i]) > 4 and parts[i][:4].lower() == 'ses-':
+        session = parts[i]
+        i += 1
+    if i < len(parts) and len(parts[i]) > 4 and parts[i][:4].lower() == 'run-':
+        run = parts[i]
+    return (subject, session, run)
 
 def generate_in_memory_pages(root_dir, phase="initial"):
     """
     Walk the directory for all runs, store data in a dictionary keyed by (sub, ses, run).
-    Then build an HTML page for each (sub, ses, run).
+    The HTML page for each (sub, ses, run) is rendered lazily by render_page.
     """
-    # Regex that captures: sub-XXXX_?ses-YYY_?run-ZZZ
-    # allowing any characters (no underscore) after 'sub-', 'ses-', 'run-'.
-    pattern = re.compile(r'(sub-[^_]+)(?:_(ses-[^_]+))?(?:_(run-[^_]+))?', re.IGNORECASE)
+    data_map = defaultdict(new_slots)  # (subject, session, run) -> dict with keys: orig, strip, dens, stats
 
-    data_map = {}  # (subject, session, run) -> dict with keys: orig, strip, dens, stats
-    # We'll parse every single file individually
-    for dirpath, _, filenames in os.walk(root_dir):
-        for fname in filenames:
-            fullpath = os.path.join(dirpath, fname)
-
-            # Check what type of file
-            if not any(x in fname for x in ["_original_slices.png",
-                                            "_skullstripped_slices.png",
-                                            "_density.svg",
-                                            "_stats.csv",
-                                            "T1w.nii.gz"]):
-                continue  # skip irrelevant files
-
-            # Attempt to parse sub/ses/run
-            match = pattern.search(fname)
-            if not match:
-                # If we can't parse, skip or store in a "misc" group if you like
-                continue
-
-            subject = match.group(1)  # e.g. sub-011228
-            session = match.group(2) if match.group(2) else 'ses-01'
-            run     = match.group(3) if match.group(3) else ''   # e.g. run-001
-
-            key = (subject, session, run)
-            if key not in data_map:
-                data_map[key] = {
-                    "orig": None,
-                    "strip": None,
-                    "dens": None,
-                    "stats": None
-                }
-
-            # Assign the file path to the correct slot
-            if fname.endswith("_original_slices.png"):
-                data_map[key]["orig"] = fullpath
-            elif fname.endswith("_skullstripped_slices.png"):
-                data_map[key]["strip"] = fullpath
-            elif fname.endswith("_density.svg"):
-                data_map[key]["dens"] = fullpath
-            elif fname.endswith("_stats.csv"):
-                data_map[key]["stats"] = fullpath
+    # Top-level directories (one per subject) are independent, so scan them in
+    # parallel; the work is dominated by I/O wait on network/Docker filesystems.
+    top_files = []
+    subdirs = []
+    try:
+        with os.scandir(root_dir) as it:
+            entries = list(it)
+    except OSError:
+        entries = []  # unreadable root: no pages, as with os.walk
+    for entry in entries:
+        if entry.is_dir():
+            if not entry.is_symlink():
+                subdirs.append(entry.path)
+        else:
+            top_files.append(entry)
+    add_entries(data_map, top_files)
+
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+        for partial in pool.map(scan_subtree, subdirs):
+            for key, slots in partial.items():
+                if key not in data_map:
+                    data_map[key] = slots
+                    continue
+                for slot, path in slots.items():
+                    if path:
+                        data_map[key][slot] = path
+
+        # Warm the stats cache so the first render of each page doesn't wait on disk
+        stats_paths = [info["stats"] for info in data_map.values() if info["stats"]]
+        list(pool.map(embed_stats, stats_paths))
 
     # Now build pages for each key
     # Sort them by numeric approach if you want (like sub-011228 => sub, ses => etc.)
@@ -212,19 +532,199 @@ def generate_in_memory_pages(root_dir, phase="initial"):
 
     sorted_keys = sorted(data_map.keys(), key=numeric_sort_key)
 
-    # clear global
-    PAGES.clear()
+    # reset globals; pages themselves are only built on request (see render_page)
+    global PHASE
+    PHASE = phase
+    SORTED_KEYS[:] = sorted_keys
+    DATA_MAP.clear()
+    DATA_MAP.update(data_map)
     FILE_MAP.clear()
-    global FILE_ID_COUNTER
-    FILE_ID_COUNTER = 0
+    PATH_TO_ID.clear()
+    render_page.cache_clear()
+
+@lru_cache(maxsize=128)
+def render_page(page_id):
+    """
+    Build the HTML page for SORTED_KEYS[page_id] the first time it is requested.
+    Only the most recently viewed pages are kept in memory.
+    """
+    key = SORTED_KEYS[page_id]
+    subject, session, run = key
+    return build_html_page(subject, session, run, DATA_MAP[key], PHASE, page_id, len(SORTED_KEYS))
 
-    # Build one page per key
-    for idx, key in enumerate(sorted_keys):
-        subject, session, run = key
-        files_info = data_map[key]
+##############################################################################
+# Page Template & Static Assets
+##############################################################################
 
-        page_html = build_html_page(subject, session, run, files_info, phase, idx, len(sorted_keys))
-        PAGES.append((page_html, idx))
+# CSS and JS are identical for every page, so they are served once from
+# /static.css and /app.js (and cached by the browser) instead of being inlined.
+# Pages link them with a ?v=<content hash> query, so a changed asset gets a
+# new URL instead of sitting in the cache for the full max-age.
+PAGE_CSS = """
+body {
+    font-family: Arial, sans-serif;
+    margin: 20px;
+}
+.nav {
+    margin-bottom: 20px;
+}
+.nav span, .nav a {
+    margin-right: 20px;
+    font-weight: bold;
+}
+.section {
+    margin-bottom: 30px;
+}
+.png-image, .svg-image {
+    max-width: 90%;
+    border: 1px solid #ccc;
+    margin-bottom: 10px;
+    display: block;
+    position: relative;
+}
+.stats-table {
+    border-collapse: collapse;
+    margin-top: 10px;
+}
+.stats-table td, .stats-table th {
+    border: 1px solid #999;
+    padding: 6px 10px;
+}
+.annotation-container {
+    position: relative;
+    display: inline-block;
+}
+.annot-canvas {
+    position: absolute;
+    top: 0;
+    left: 0;
+    border: 1px solid #ccc;
+    opacity: 0.6;
+}
+.qc-buttons {
+    margin: 20px 0;
+}
+.qc-buttons button {
+    margin-right: 10px;
+    padding: 8px 12px;
+    font-size: 14px;
+    cursor: pointer;
+}
+.qc-status {
+    font-weight: bold;
+    margin-left: 20px;
+}
+"""
+
+PAGE_JS = """
+function markQC(status) {
+    document.getElementById('qcStatusDisplay').innerText = "Status: " + status;
+    const notes = document.getElementById('qcNotes').value;
+    fetch("/qc_update", {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json"
+        },
+        body: JSON.stringify({ filename: document.body.dataset.filename, status: status, notes: notes })
+    })
+    .then(r => r.json())
+    .then(d => console.log(d))
+    .catch(err => console.error("Error:", err));
+}
+
+function resizeCanvas(imgElem) {
+    let canvas = imgElem.parentNode.querySelector('.annot-canvas');
+    if (canvas) {
+        canvas.width = imgElem.width;
+        canvas.height = imgElem.height;
+    }
+}
+
+function resizeSvgCanvas(objElem) {
+    let canvas = objElem.parentNode.querySelector('.annot-canvas');
+    if (canvas) {
+        // You can refine logic to match the rendered size of the SVG
+        canvas.width = 600;
+        canvas.height = 400;
+    }
+}
+
+// For each annotation container, freehand drawing
+document.addEventListener('DOMContentLoaded', function() {
+    const containers = document.querySelectorAll('.annotation-container');
+    containers.forEach(container => {
+        const canvas = container.querySelector('.annot-canvas');
+        if (!canvas) return;
+        const ctx = canvas.getContext('2d');
+        let drawing = false;
+        function startDraw(e) {
+            drawing = true;
+            ctx.beginPath();
+            ctx.moveTo(e.offsetX, e.offsetY);
+        }
+        function draw(e) {
+            if (!drawing) return;
+            ctx.lineWidth = 2;
+            ctx.lineCap = 'round';
+            ctx.strokeStyle = 'red';
+            ctx.lineTo(e.offsetX, e.offsetY);
+            ctx.stroke();
+        }
+        function endDraw(e) {
+            drawing = false;
+        }
+        canvas.addEventListener('mousedown', startDraw);
+        canvas.addEventListener('mousemove', draw);
+        canvas.addEventListener('mouseup', endDraw);
+        canvas.addEventListener('mouseleave', endDraw);
+    });
+});
+"""
+
+CSS_VERSION = hashlib.sha1(PAGE_CSS.encode("utf-8")).hexdigest()[:12]
+JS_VERSION = hashlib.sha1(PAGE_JS.encode("utf-8")).hexdigest()[:12]
+
+PAGE_TEMPLATE = string.Template("""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8" />
+    <title>$subject $session $run Report ($phase)</title>
+    <link rel="stylesheet" href="/static.css?v=$css_version" />
+    <script src="/app.js?v=$js_version"></script>
+</head>
+<body data-filename="$csv_filename_key">
+
+<div class="nav">
+    $prev_link $next_link
+</div>
+
+<h2>Subject: $subject | Session: $session | Run: $run | Phase: $phase</h2>
+
+<div class="qc-buttons">
+    <button onclick="markQC('GOOD')">Good</button>
+    <button onclick="markQC('BAD')">Bad</button>
+    <button onclick="markQC('UNCLEAR')">Unclear</button>
+    <span class="qc-status" id="qcStatusDisplay">Status: UNKNOWN</span>
+    <label for="qcNotes" style="margin-left: 20px;">Notes:</label>
+    <input type="text" id="qcNotes" style="width: 200px; margin-left: 5px; padding: 5px;" onchange="saveNotes()" placeholder="Add notes here..."/>
+</div>
+
+<div class="section">
+    $orig_html
+</div>
+<div class="section">
+    $strip_html
+</div>
+<div class="section">
+    $dens_html
+</div>
+<div class="section">
+    $stats_html
+</div>
+
+</body>
+</html>
+""")
 
 def build_html_page(subject, session, run, files_info, phase, page_id, total_pages):
     """
@@ -264,150 +764,21 @@ def build_html_page(subject, session, run, files_info, phase, page_id, total_pag
         # fallback
         csv_filename_key = f"{subject}_{session}_{run}"
 
-    # Build the HTML
-    html = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8" />
-    <title>{subject} {session} {run} Report ({phase})</title>
-    <style>
-        body {{
-            font-family: Arial, sans-serif;
-            margin: 20px;
-        }}
-        .nav {{
-            margin-bottom: 20px;
-        }}
-        .nav span, .nav a {{
-            margin-right: 20px;
-            font-weight: bold;
-        }}
-        .section {{
-            margin-bottom: 30px;
-        }}
-        .png-image, .svg-image {{
-            max-width: 90%;
-            border: 1px solid #ccc;
-            margin-bottom: 10px;
-            display: block;
-            position: relative;
-        }}
-        .stats-table {{
-            border-collapse: collapse;
-            margin-top: 10px;
-        }}
-        .stats-table td, .stats-table th {{
-            border: 1px solid #999;
-            padding: 6px 10px;
-        }}
-        .annotation-container {{
-            position: relative;
-            display: inline-block;
-        }}
-        .annot-canvas {{
-            position: absolute;
-            top: 0;
-            left: 0;
-            border: 1px solid #ccc;
-            opacity: 0.6;
-        }}
-        .qc-buttons {{
-            margin: 20px 0;
-        }}
-        .qc-buttons button {{
-            margin-right: 10px;
-            padding: 8px 12px;
-            font-size: 14px;
-            cursor: pointer;
-        }}
-        .qc-status {{
-            font-weight: bold;
-            margin-left: 20px;
-        }}
-    </style>
-</head>
-<body>
-
-<div class="nav">
-    {prev_link} {next_link}
-</div>
-
-<h2>Subject: {subject} | Session: {session} | Run: {run} | Phase: {phase}</h2>
-
-<div class="qc-buttons">
-    <button onclick="markQC('GOOD')">Good</button>
-    <button onclick="markQC('BAD')">Bad</button>
-    <button onclick="markQC('UNCLEAR')">Unclear</button>
-    <span class="qc-status" id="qcStatusDisplay">Status: UNKNOWN</span>
-    <label for="qcNotes" style="margin-left: 20px;">Notes:</label>
-    <input type="text" id="qcNotes" style="width: 200px; margin-left: 5px; padding: 5px;" onchange="saveNotes()" placeholder="Add notes here..."/>
-</div>
-
-<div class="section">
-    {orig_html}
-</div>
-<div class="section">
-    {strip_html}
-</div>
-<div class="section">
-    {dens_html}
-</div>
-<div class="section">
-    {stats_html}
-</div>
-
-<script>
-function markQC(status) {{
-    document.getElementById('qcStatusDisplay').innerText = "Status: " + status;
-    const notes = document.getElementById('qcNotes').value;
-    fetch("/qc_update", {{
-        method: "POST",
-        headers: {{
-            "Content-Type": "application/json"
-        }},
-        body: JSON.stringify({{ filename: "{csv_filename_key}", status: status, notes: notes }})
-    }})
-    .then(r => r.json())
-    .then(d => console.log(d))
-    .catch(err => console.error("Error:", err));
-}}
-
-// For each annotation container, freehand drawing
-document.addEventListener('DOMContentLoaded', function() {{
-    const containers = document.querySelectorAll('.annotation-container');
-    containers.forEach(container => {{
-        const canvas = container.querySelector('.annot-canvas');
-        if (!canvas) return;
-        const ctx = canvas.getContext('2d');
-        let drawing = false;
-        function startDraw(e) {{
-            drawing = true;
-            ctx.beginPath();
-            ctx.moveTo(e.offsetX, e.offsetY);
-        }}
-        function draw(e) {{
-            if (!drawing) return;
-            ctx.lineWidth = 2;
-            ctx.lineCap = 'round';
-            ctx.strokeStyle = 'red';
-            ctx.lineTo(e.offsetX, e.offsetY);
-            ctx.stroke();
-        }}
-        function endDraw(e) {{
-            drawing = false;
-        }}
-        canvas.addEventListener('mousedown', startDraw);
-        canvas.addEventListener('mousemove', draw);
-        canvas.addEventListener('mouseup', endDraw);
-        canvas.addEventListener('mouseleave', endDraw);
-    }});
-}});
-</script>
-
-</body>
-</html>
-"""
-    return html
+    return PAGE_TEMPLATE.substitute(
+        subject=subject,
+        session=session,
+        run=run,
+        phase=phase,
+        css_version=CSS_VERSION,
+        js_version=JS_VERSION,
+        csv_filename_key=html.escape(csv_filename_key, quote=True),
+        prev_link=prev_link,
+        next_link=next_link,
+        orig_html=orig_html,
+        strip_html=strip_html,
+        dens_html=dens_html,
+        stats_html=stats_html,
+    )
 
 
 ##############################################################################
@@ -427,15 +798,6 @@ def embed_png(abs_path, title="Image"):
         <img class="png-image" src="/get_image/{file_id}" onload="resizeCanvas(this)" />
         <canvas class="annot-canvas"></canvas>
     </div>
-    <script>
-    function resizeCanvas(imgElem) {{
-        let canvas = imgElem.parentNode.querySelector('.annot-canvas');
-        if (canvas) {{
-            canvas.width = imgElem.width;
-            canvas.height = imgElem.height;
-        }}
-    }}
-    </script>
     """
 
 def embed_svg(abs_path, title="Image"):
@@ -451,16 +813,6 @@ def embed_svg(abs_path, title="Image"):
         <object class="svg-image" type="image/svg+xml" data="/get_image/{file_id}" onload="resizeSvgCanvas(this)"></object>
         <canvas class="annot-canvas"></canvas>
     </div>
-    <script>
-    function resizeSvgCanvas(objElem) {{
-        let canvas = objElem.parentNode.querySelector('.annot-canvas');
-        if (canvas) {{
-            // You can refine logic to match the rendered size of the SVG
-            canvas.width = 600;
-            canvas.height = 400;
-        }}
-    }}
-    </script>
     """
 
 def not_found(title="Item"):
@@ -468,21 +820,36 @@ def not_found(title="Item"):
 
 def embed_stats(abs_path):
     """
-    Minimal approach: parse first line(s) for mean, median, max, min, std
+    Render the stats block for abs_path, re-parsing the CSV only if it changed
+    on disk since the last time we rendered it.
     """
     if not abs_path:
         return not_found("Stats")
     try:
-        with open(abs_path, 'r', encoding='utf-8') as f:
-            lines = [line.strip() for line in f if line.strip()]
+        mtime = os.path.getmtime(abs_path)
+    except OSError as e:
+        return f"<h3>Stats</h3><p>Error reading CSV: {e}</p>"
+    cached = _STATS_CACHE.get(abs_path)
+    if cached and cached[1] == mtime:
+        return cached[0]
+    block = parse_stats(abs_path)
+    _STATS_CACHE[abs_path] = (block, mtime)
+    return block
+
+def parse_stats(abs_path):
+    """
+    Minimal approach: parse first line(s) for mean, median, max, min, std
+    """
+    try:
+        lines = first_lines(abs_path, 2)
         if len(lines) == 0:
             return "<h3>Stats</h3><p>Empty CSV</p>"
         # If there's a header, second line is numeric
-        parts = None
-        if len(lines) >= 2 and all_numeric(lines[1].split(',')):
-            parts = lines[1].split(',')
+        if len(lines) >= 2 and all_numeric(lines[1]):
+            data_line = lines[1]
         else:
-            parts = lines[0].split(',')
+            data_line = lines[0]
+        parts = data_line.decode('utf-8').split(',')
 
         if len(parts) != 5:
             return f"<h3>Stats</h3><p>Expected 5 columns, found {len(parts)}. CSV: {abs_path}</p>"
@@ -494,35 +861,81 @@ def embed_stats(abs_path):
     except Exception as e:
         return f"<h3>Stats</h3><p>Error reading CSV: {e}</p>"
 
-def all_numeric(vals):
-    try:
-        for v in vals:
-            float(v)
-        return True
-    except ValueError:
-        return False
+def first_lines(abs_path, n):
+    """
+    Return up to n non-blank lines from the start of abs_path, stripped, as bytes.
+    The file is memory-mapped and scanned with find(), so nothing past those
+    lines is read or split.
+    """
+    lines = []
+    with open(abs_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return lines
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            size = len(mm)
+            start = 0
+            while start < size and len(lines) < n:
+                end = mm.find(b'\n', start)
+                if end < 0:
+                    end = size
+                line = mm[start:end].strip()
+                if line:
+                    lines.append(line)
+                start = end + 1
+        finally:
+            mm.close()
+    return lines
+
+def all_numeric(line):
+    """
+    True if the bytes line is a comma-separated list of numbers (anything
+    float() accepts, including nan/inf), checked with one regex match.
+    """
+    return NUMERIC_LINE.match(line) is not None
 
 def store_file(abs_path):
     """
-    Adds abs_path to FILE_MAP with a new integer ID, returns that ID.
+    Return the integer ID for abs_path in FILE_MAP, adding it if it's new.
+    The same path always maps to the same ID, so re-rendering a page does not
+    grow FILE_MAP.
+    """
+    file_id = PATH_TO_ID.get(abs_path)
+    if file_id is None:
+        with FILE_MAP_LOCK:
+            file_id = PATH_TO_ID.get(abs_path)
+            if file_id is None:
+                file_id = len(FILE_MAP)
+                FILE_MAP[file_id] = (abs_path, guess_mimetype(abs_path))
+                PATH_TO_ID[abs_path] = file_id
+    return file_id
+
+def guess_mimetype(abs_path):
+    """
+    Guess the mimetype from the file extension.
     """
-    global FILE_ID_COUNTER
-    FILE_MAP[FILE_ID_COUNTER] = abs_path
-    this_id = FILE_ID_COUNTER
-    FILE_ID_COUNTER += 1
-    return this_id
+    ext = abs_path.lower()
+    if ext.endswith(".png"):
+        return "image/png"
+    elif ext.endswith(".svg"):
+        return "image/svg+xml"
+    # fallback guess
+    return "application/octet-stream"
 
 def parse_int(s):
     """
     Extract an integer from a string like '6mo' or '001'. If we can't parse, return 0.
     """
     # e.g. "001" -> 1, "6mo" -> 6 (if you want), else fallback 0
-    # This is a naive approach. Adapt if you prefer a more robust parse.
-    import re
-    m = re.search(r'(\d+)', s)
-    if m:
-        return int(m.group(1))
-    return 0
+    # Scan for the first run of digits by hand; this runs for every key we sort.
+    i = 0
+    n = len(s)
+    while i < n and not s[i].isdecimal():
+        i += 1
+    j = i
+    while j < n and s[j].isdecimal():
+        j += 1
+    return int(s[i:j]) if j > i else 0
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
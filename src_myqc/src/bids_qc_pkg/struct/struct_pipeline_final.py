@@ -1,16 +1,32 @@
 import os
+import re
+import csv
 import sys
 import logging
 import argparse
+import tempfile
+import subprocess
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import nibabel as nib
-import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # headless: scans may be processed in worker processes
 import matplotlib.pyplot as plt
-import seaborn as sns
+from numba import njit, prange, set_num_threads
 
 logger = logging.getLogger(__name__)
 
+DENSITY_BINS = 256  # histogram bins for the density plot
+DENSITY_SMOOTH = 2.0  # Gaussian smoothing of the histogram, in bins
+NIFTI_EXTS = (".nii", ".nii.gz")
+STRIPPED_SUFFIX = "_skullstripped.nii.gz"  # final-QC output written next to the scan
+_SUB_SES_RE = re.compile(r'(sub-\d+)_?(ses-\d+)?')
+SYNTHSTRIP_IMAGE = "freesurfer/synthstrip:latest"
+_DOCKER_IMAGE_READY = None  # set once the image is known to be present
+_RESULTS_DIRS = {}  # (bids_root, scan dir) -> results dir already created
+
 ###############################################################################
 # Skull Stripping
 ###############################################################################
@@ -20,19 +36,24 @@ def ensure_docker_image():
     Returns True if image is available (either existed or successfully pulled),
     False otherwise.
     """
+    global _DOCKER_IMAGE_READY
+    if _DOCKER_IMAGE_READY:
+        return True
     try:
-        # Check if image exists locally
-        check_cmd = "docker images -q freesurfer/synthstrip:latest"
-        image_exists = os.system(check_cmd) == 0 and os.popen(check_cmd).read().strip() != ""
-        
+        # Check if image exists locally (a single docker call, output captured)
+        check = subprocess.run(["docker", "images", "-q", SYNTHSTRIP_IMAGE],
+                               capture_output=True, text=True)
+        image_exists = check.returncode == 0 and check.stdout.strip() != ""
+
         if not image_exists:
             logger.info("SynthStrip Docker image not found locally. Pulling from Docker Hub...")
-            pull_cmd = "docker pull --platform linux/amd64 freesurfer/synthstrip:latest"
-            if os.system(pull_cmd) != 0:
+            pull = subprocess.run(["docker", "pull", "--platform", "linux/amd64", SYNTHSTRIP_IMAGE])
+            if pull.returncode != 0:
                 logger.error("Failed to pull SynthStrip Docker image")
                 return False
             logger.info("Successfully pulled SynthStrip Docker image")
-        
+
+        _DOCKER_IMAGE_READY = True
         return True
     except Exception as e:
         logger.error(f"Error checking/pulling Docker image: {str(e)}")
@@ -41,17 +62,13 @@ def ensure_docker_image():
 def process_skull_stripping(filepath):
     """
     Perform skull stripping using SynthStrip Docker container and save the output 
-    in the same directory as the original file.
+    in the same directory as the original file. The image is expected to be
+    present already (see ensure_docker_image, called once from main()).
 
     Returns:
         str or None: Path to the skull-stripped NIfTI file, or None if an error occurred.
     """
     try:
-        # Ensure Docker image is available
-        if not ensure_docker_image():
-            logger.error("Could not ensure Docker image availability")
-            return None
-
         # Remove double extension for .nii.gz vs .nii
         base_no_ext = os.path.splitext(os.path.splitext(filepath)[0])[0]
         output_path = f"{base_no_ext}_skullstripped.nii.gz"
@@ -62,16 +79,16 @@ def process_skull_stripping(filepath):
         filename = os.path.basename(abs_filepath)
         stripped_filename = os.path.basename(output_path)
 
-        cmd = f"""
-        docker run --platform linux/amd64 \
-        -v "{parent_dir}":/data \
-        freesurfer/synthstrip:latest \
-        -i /data/{filename} \
-        -o /data/{stripped_filename}
-        """
+        cmd = [
+            "docker", "run", "--platform", "linux/amd64",
+            "-v", f"{parent_dir}:/data",
+            SYNTHSTRIP_IMAGE,
+            "-i", f"/data/{filename}",
+            "-o", f"/data/{stripped_filename}",
+        ]
 
         logger.info(f"Running SynthStrip on {filepath}...")
-        exit_code = os.system(cmd)
+        exit_code = subprocess.run(cmd).returncode
         if exit_code != 0:
             logger.error(f"Skull stripping failed with exit code {exit_code}")
             return None
@@ -82,20 +99,102 @@ def process_skull_stripping(filepath):
         logger.error(f"process_skull_stripping failed for {filepath}: {str(e)}")
         return None
 
+def process_skull_stripping_batch(filepaths):
+    """
+    Skull-strip many files with a single SynthStrip container instead of
+    starting one container per scan (container start-up dominates the run
+    time on small volumes). The common parent directory of all inputs is
+    mounted once and the container loops over a manifest of relative paths.
+    Outputs are written next to each input, named as in process_skull_stripping.
+
+    Returns:
+        dict: input filepath -> path of the skull-stripped file, or None if
+              it was not produced.
+    """
+    if not filepaths:
+        return {}
+
+    abs_paths = [os.path.abspath(fp) for fp in filepaths]
+    mount_dir = os.path.commonpath([os.path.dirname(fp) for fp in abs_paths])
+    outputs = {}
+    for fp, abs_fp in zip(filepaths, abs_paths):
+        base_no_ext = os.path.splitext(os.path.splitext(abs_fp)[0])[0]
+        outputs[fp] = f"{base_no_ext}_skullstripped.nii.gz"
+
+    manifest = None
+    try:
+        with tempfile.NamedTemporaryFile("w", dir=mount_dir, prefix=".synthstrip_",
+                                         suffix=".txt", delete=False) as f:
+            manifest = f.name
+            for abs_fp in abs_paths:
+                f.write(os.path.relpath(abs_fp, mount_dir) + "\n")
+
+        script = (
+            'while IFS= read -r f; do '
+            'mri_synthstrip -i "/data/$f" -o "/data/${f%.nii*}_skullstripped.nii.gz"; '
+            f'done < "/data/{os.path.basename(manifest)}"'
+        )
+        cmd = [
+            "docker", "run", "--rm", "--platform", "linux/amd64",
+            "-v", f"{mount_dir}:/data",
+            "--entrypoint", "sh",
+            SYNTHSTRIP_IMAGE,
+            "-c", script,
+        ]
+        logger.info(f"Running SynthStrip on {len(filepaths)} files in one container...")
+        result = subprocess.run(cmd)
+        if result.returncode != 0:
+            logger.error(f"Batch skull stripping failed with exit code {result.returncode}")
+    except Exception as e:
+        logger.error(f"process_skull_stripping_batch failed: {str(e)}")
+    finally:
+        if manifest and os.path.exists(manifest):
+            os.remove(manifest)
+
+    return {fp: (out if os.path.exists(out) else None) for fp, out in outputs.items()}
+
 ###############################################################################
 # Slice Selection & Plotting
 ###############################################################################
 import numpy as np
 
-def find_slices_of_interest(data, num_slices=10):
+@njit(parallel=True, fastmath=True, cache=True)
+def _slice_sums(vol, out):
+    """
+    Sum each axial slice of a 3D volume into out (one prange task per slice).
+    The x loop is innermost to follow NIfTI's Fortran-ordered layout.
+    """
+    nx, ny, nz = vol.shape
+    for z in prange(nz):
+        s = out[z]
+        for y in range(ny):
+            for x in range(nx):
+                s += vol[x, y, z]
+        out[z] = s
+    return out
+
+
+def find_slices_of_interest(data, num_slices=10, slope=1.0):
     """
     1) Find the single slice with the highest sum of intensities (best_idx).
     2) Create a bounding region [start_idx, end_idx] around best_idx.
     3) Use np.linspace to pick num_slices slices evenly spaced in that region.
     
+    `data` may be the raw on-disk array (e.g. int16): the sums are
+    accumulated in its native dtype, and a negative `slope` flips the order.
+
     Returns up to num_slices slices (clamped to image boundaries).
     """
-    slice_sums = np.sum(data, axis=(0, 1))
+    if data.dtype.kind in "iubf":
+        acc = np.float64 if data.dtype.kind == "f" else np.int64
+        # Numba only types native byte order; big-endian files need a swapped copy
+        data = np.asarray(data)
+        data = data.astype(data.dtype.newbyteorder('='), copy=False)
+        slice_sums = _slice_sums(data, np.zeros(data.shape[2], dtype=acc))
+    else:
+        slice_sums = np.add.reduce(data, axis=(0, 1))
+    if slope < 0:
+        slice_sums = -slice_sums
     best_idx = np.argmax(slice_sums)
 
     # We'll define a margin to pick from best_idx-margin to best_idx+margin
@@ -118,39 +217,148 @@ def find_slices_of_interest(data, num_slices=10):
     return slice_indices
 
 
+_PLOT_CACHE = {}  # (nrows, ncols) -> (fig, ax, image, labels), reused across scans
+SUBPLOT_DEFAULTS = {k: plt.rcParams[f"figure.subplot.{k}"]
+                    for k in ("left", "right", "bottom", "top", "wspace", "hspace")}
+
+def _slice_figure(nrows, ncols):
+    """
+    Return the (fig, ax, image, labels) used for this grid, building it on
+    first use. The figure is kept open and updated in place, which avoids
+    rebuilding a Figure for every scan.
+    """
+    cached = _PLOT_CACHE.get((nrows, ncols))
+    if cached is None:
+        fig, ax = plt.subplots(figsize=(4*ncols, 4*nrows))
+        image = ax.imshow(np.zeros((1, 1)), cmap='gray', vmin=0.0, vmax=1.0)
+        labels = [ax.text(0, 0, "", ha='center', va='center') for _ in range(nrows * ncols)]
+        ax.axis('off')
+        cached = _PLOT_CACHE[(nrows, ncols)] = (fig, ax, image, labels)
+    return cached
+
+
+def slice_mosaic(data, slice_indices, nrows, ncols):
+    """
+    Tile the chosen axial slices row-major into a single 2D array.
+
+    Each tile is scaled to its own [0, 1] range (as a per-slice imshow would
+    be) and has a blank band above it for its label; unused cells are NaN
+    and render blank.
+
+    Returns:
+        tuple: (mosaic array, list of (x, y) label centres)
+    """
+    height, width = data.shape[1], data.shape[0]
+    band, gap = max(8, height // 8), max(4, width // 16)
+    cell_h, cell_w = height + band, width + gap
+    mosaic = np.full((nrows * cell_h, ncols * cell_w - gap), np.nan, dtype=np.float32)
+    centers = []
+    for k, idx in enumerate(slice_indices[:nrows * ncols]):
+        tile = data[:, :, idx].T  # transpose for correct orientation
+        lo, hi = np.nanmin(tile), np.nanmax(tile)
+        r, c = divmod(k, ncols)
+        y, x = r * cell_h + band, c * cell_w
+        out = mosaic[y:y + height, x:x + width]
+        if hi > lo:
+            np.subtract(tile, lo, out=out)
+            out /= hi - lo
+        else:
+            out[:] = 0.0
+        centers.append((x + (width - 1) / 2, y - band / 2))
+    return mosaic, centers
+
+
 def plot_slices(data, slice_indices, output_path, title="", nrows=5, ncols=2):
     """
     Plot specified axial slice indices of a 3D volume in a grid (nrows x ncols)
-    and save as an SVG.
+    and save as a PNG. The grid is drawn as one mosaic image.
 
     Args:
         data (np.ndarray): 3D image data
         slice_indices (list or np.ndarray): Indices of slices to plot
         output_path (str): Output file path for saving the figure
         title (str): A title for the figure
-        nrows (int): Number of rows in the subplot grid
-        ncols (int): Number of columns in the subplot grid
-    """
-    fig, axes = plt.subplots(nrows=nrows, ncols=ncols, figsize=(4*ncols, 4*nrows))
-    for i, ax in enumerate(axes.flat):
-        if i < len(slice_indices):
-            idx = slice_indices[i]
-            slice_data = data[:, :, idx].T  # transpose for correct orientation
-            # Flip up-down so slice 0 is at bottom
-            ax.imshow(np.flipud(slice_data), cmap='gray', origin='lower')
-            ax.set_title(f"Slice {idx}")
-            ax.axis('off')
-        else:
-            ax.axis('off')
-
-    plt.suptitle(title)
-    plt.tight_layout()
-    plt.savefig(output_path, format='png', bbox_inches='tight')
-    plt.close(fig)
+        nrows (int): Number of rows in the grid
+        ncols (int): Number of columns in the grid
+    """
+    fig, ax, image, labels = _slice_figure(nrows, ncols)
+    mosaic, centers = slice_mosaic(data, slice_indices, nrows, ncols)
+    h, w = mosaic.shape
+    # Match the figure to the mosaic's aspect (plus room for the title) so the
+    # saved PNG has no empty margins to trim
+    fig.set_size_inches(4*ncols, 4*ncols * h / w + 0.5)
+    image.set_data(mosaic)
+    image.set_extent((-0.5, w - 0.5, h - 0.5, -0.5))
+    ax.set_xlim(-0.5, w - 0.5)
+    ax.set_ylim(h - 0.5, -0.5)
+    for label, idx, xy in zip(labels, slice_indices, centers):
+        label.set_position(xy)
+        label.set_text(f"Slice {idx}")
+    for label in labels[len(centers):]:
+        label.set_text("")
+
+    fig.suptitle(title)
+    # tight_layout starts from the current subplot params, so reset them first
+    fig.subplots_adjust(**SUBPLOT_DEFAULTS)
+    fig.tight_layout()
+    # tight_layout already fits the margins, so skip bbox_inches='tight' (a second
+    # render pass); zlib level 1 is much cheaper than the default 6 for these previews
+    fig.savefig(output_path, format='png', dpi=90, pil_kwargs={'compress_level': 1})
 
 ###############################################################################
 # Analysis
 ###############################################################################
+@njit(parallel=True, cache=True)
+def _fused_moments(flat):
+    """
+    Single pass over a 1D array computing sum, sum of squares, min and max,
+    instead of one full pass per np.mean/np.std/np.min/np.max call.
+    """
+    total = 0.0
+    total_sq = 0.0
+    lo = np.inf
+    hi = -np.inf
+    for i in prange(flat.size):
+        v = float(flat[i])
+        total += v
+        total_sq += v * v
+        lo = min(lo, v)
+        hi = max(hi, v)
+    return total, total_sq, lo, hi
+
+def _median(flat):
+    """
+    Median via np.partition (O(N) selection) rather than np.median's sort.
+    """
+    n = flat.size
+    k = n // 2
+    if n % 2:
+        return np.partition(flat, k)[k]
+    part = np.partition(flat, [k - 1, k])
+    return (float(part[k - 1]) + float(part[k])) / 2.0
+
+def _stats_from_array(data):
+    """
+    Compute basic intensity stats of an already loaded volume.
+
+    Returns:
+        dict: {mean, median, max, min, std}
+    """
+    flat = data.ravel(order='K')
+    total, total_sq, lo, hi = _fused_moments(flat)
+    if np.isnan(total) and np.isnan(flat).any():
+        # min/max skip NaN and partition sorts it last; NumPy would give NaN throughout
+        return dict.fromkeys(('mean', 'median', 'max', 'min', 'std'), float('nan'))
+    n = flat.size
+    mean = total / n
+    return {
+        'mean': float(mean),
+        'median': float(_median(flat)),
+        'max': float(hi),
+        'min': float(lo),
+        'std': float(np.sqrt(max(total_sq / n - mean * mean, 0.0)))
+    }
+
 def analyze_nifti(filepath):
     """
     Load a NIfTI file, compute basic intensity stats, and return them as a dict.
@@ -159,50 +367,128 @@ def analyze_nifti(filepath):
         dict: {mean, median, max, min, std} or empty dict on error
     """
     try:
-        img = nib.load(filepath)
-        data = img.get_fdata()
-
-        stats = {
-            'mean': float(np.mean(data)),
-            'median': float(np.median(data)),
-            'max': float(np.max(data)),
-            'min': float(np.min(data)),
-            'std': float(np.std(data))
-        }
-        return stats
+        img = nib.load(filepath, mmap=False)
+        # float32 halves the bytes moved compared to get_fdata()'s float64
+        return _stats_from_array(np.asarray(img.dataobj, dtype=np.float32))
     except Exception as e:
         logger.error(f"analyze_nifti failed for {filepath}: {str(e)}")
         return {}
 
+def load_volume(img):
+    """
+    Read the voxels of a loaded image once.
+
+    Returns:
+        tuple: (raw array in its on-disk dtype, scale slope, scaled float32 array)
+    """
+    dataobj = img.dataobj
+    if not hasattr(dataobj, "get_unscaled"):
+        data = np.asarray(dataobj, dtype=np.float32)
+        return data, 1.0, data
+    raw = np.asanyarray(dataobj.get_unscaled())
+    slope, inter = float(dataobj.slope), float(dataobj.inter)
+    data = raw.astype(np.float32)
+    if slope != 1.0:
+        data *= np.float32(slope)
+    if inter != 0.0:
+        data += np.float32(inter)
+    return raw, slope, data
+
+
+def write_stats_csv(path, stats):
+    """
+    Write a one-row stats dict as a header line plus a value line.
+    """
+    with open(path, 'w') as f:
+        f.write(",".join(stats) + "\n")
+        # NaN is written as an empty field, as DataFrame.to_csv did
+        f.write(",".join("" if v != v else str(v) for v in stats.values()) + "\n")
+
+
 def create_density_plot_and_save(data, output_path, title=""):
     """
-    Create a density (KDE) plot of voxel intensities and save it to SVG.
+    Create a density plot of voxel intensities (a smoothed histogram) and
+    save it to SVG.
     """
-    plt.figure(figsize=(10, 6))
-    sns.kdeplot(data=data.flatten(), shade=False)
-    plt.title(title)
-    plt.xlabel("Image Intensity")
-    plt.ylabel("Density")
-    plt.savefig(output_path, format='svg', bbox_inches='tight')
-    plt.close()
+    flat = data.ravel()
+    lo, hi = float(flat.min()), float(flat.max())
+    if not (np.isfinite(lo) and np.isfinite(hi)):
+        flat = flat[np.isfinite(flat)]
+        lo, hi = (float(flat.min()), float(flat.max())) if flat.size else (0.0, 1.0)
+    counts, edges = np.histogram(flat, bins=DENSITY_BINS, range=(lo, hi))
+    density = counts / max(counts.sum(), 1) / np.diff(edges)
+    # A small Gaussian kernel smooths the histogram into a KDE-like curve
+    offsets = np.arange(-3 * DENSITY_SMOOTH, 3 * DENSITY_SMOOTH + 1)
+    kernel = np.exp(-0.5 * (offsets / DENSITY_SMOOTH) ** 2)
+    density = np.convolve(density, kernel / kernel.sum(), mode='same')
+    centers = 0.5 * (edges[:-1] + edges[1:])
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.plot(centers, density)
+    ax.set_title(title)
+    ax.set_xlabel("Image Intensity")
+    ax.set_ylabel("Density")
+    fig.savefig(output_path, format='svg', bbox_inches='tight')
+    plt.close(fig)
 
 
-def process_scan_final(bids_root, filepath, num_slices=10):
+def results_dir_for(bids_root, filepath):
+    """
+    Mirror of the scan's directory under <bids_root>/results.
+    """
+    rel_path = os.path.relpath(os.path.dirname(filepath), bids_root)
+    return os.path.join(bids_root, "results", rel_path)
+
+def ensure_results_dir(bids_root, filepath):
+    """
+    Create (once per directory) and return the results directory for filepath.
+    """
+    key = (bids_root, os.path.dirname(filepath))
+    results_dir = _RESULTS_DIRS.get(key)
+    if results_dir is None:
+        results_dir = results_dir_for(bids_root, filepath)
+        os.makedirs(results_dir, exist_ok=True)
+        _RESULTS_DIRS[key] = results_dir
+    return results_dir
+
+def final_outputs(bids_root, filepath):
+    """
+    Paths of everything process_scan_final writes for filepath.
+    """
+    base_no_ext = os.path.splitext(os.path.splitext(os.path.basename(filepath))[0])[0]
+    results_dir = results_dir_for(bids_root, filepath)
+    return [os.path.join(results_dir, f"{base_no_ext}{suffix}") for suffix in
+            ("_skullstripped_slices.png", "_original_slices.png", "_stats.csv", "_density.svg")]
+
+def _stripped_path(filepath):
+    """
+    Path of the skull-stripped file SynthStrip writes next to filepath.
+    """
+    base_no_ext = os.path.splitext(os.path.splitext(os.path.basename(filepath))[0])[0]
+    return os.path.join(os.path.dirname(filepath), f"{base_no_ext}_skullstripped.nii.gz")
+
+def process_scan_final(bids_root, filepath, num_slices=10, docker_ready=True, force=False):
     """
     Final pass: Perform skull-stripping and produce original vs stripped slices, stats, etc.
+    docker_ready tells the worker whether the SynthStrip image is available,
+    so it never has to check (or pull) it itself.
+    Scans whose outputs all exist already are skipped unless force is set.
     """
+    if not force and all(os.path.exists(p) for p in final_outputs(bids_root, filepath)):
+        logger.info(f"[Final QC] Outputs for {filepath} already exist, skipping.")
+        return
+
     base_no_ext = os.path.splitext(os.path.splitext(os.path.basename(filepath))[0])[0]
     logger.info(f"[Final QC] Processing {filepath} ...")
 
     # 1) If skull-stripped file doesn't exist, run it
-    stripped_filename = f"{base_no_ext}_skullstripped.nii.gz"
-    stripped_path = os.path.join(os.path.dirname(filepath), stripped_filename)
+    stripped_path = _stripped_path(filepath)
 
     if os.path.exists(stripped_path):
         logger.info(f"Found existing skull-stripped file: {stripped_path}")
     else:
-        if not ensure_docker_image():
-            logger.error("Could not ensure Docker image availability. Skipping.")
+        if not docker_ready:
+            logger.error("SynthStrip Docker image is not available. Skipping.")
             return
 
         logger.info(f"No skull-stripped file found. Running skull stripping on {filepath}...")
@@ -213,9 +499,11 @@ def process_scan_final(bids_root, filepath, num_slices=10):
         stripped_path = result_path
 
     # 2) Load stripped data & find slices
-    stripped_img = nib.load(stripped_path)
-    stripped_data = stripped_img.get_fdata()
-    slice_indices = find_slices_of_interest(stripped_data, num_slices=num_slices)
+    # Slice sums run over the on-disk dtype; the scaled copy is only for plotting
+    # (mmap=False reads a .nii straight into memory instead of faulting pages in)
+    stripped_raw, stripped_slope, stripped_data = load_volume(nib.load(stripped_path, mmap=False))
+    slice_indices = find_slices_of_interest(stripped_raw, num_slices=num_slices, slope=stripped_slope)
+    del stripped_raw
 
     # 3) Plot & save slices to results folder
     results_dir = ensure_results_dir(bids_root, filepath)
@@ -231,7 +519,8 @@ def process_scan_final(bids_root, filepath, num_slices=10):
         ncols=5
     )
 
-    original_data = nib.load(filepath).get_fdata()
+    # Loaded once and reused for the slices, the stats and the density plot
+    original_data = np.asarray(nib.load(filepath, mmap=False).dataobj, dtype=np.float32)
     plot_slices(
         original_data,
         slice_indices,
@@ -242,10 +531,10 @@ def process_scan_final(bids_root, filepath, num_slices=10):
     )
 
     # 4) Stats & density for original
-    intensity_stats = analyze_nifti(filepath)
+    intensity_stats = _stats_from_array(original_data)
     if intensity_stats:
         stats_csv_path = os.path.join(results_dir, f"{base_no_ext}_stats.csv")
-        pd.DataFrame([intensity_stats]).to_csv(stats_csv_path, index=False)
+        write_stats_csv(stats_csv_path, intensity_stats)
 
         density_svg_path = os.path.join(results_dir, f"{base_no_ext}_density.svg")
         create_density_plot_and_save(
@@ -256,34 +545,103 @@ def process_scan_final(bids_root, filepath, num_slices=10):
 
     logger.info(f"[Final QC] Finished processing {filepath}.\n")
 
-def traverse_bids_final(bids_root, accepted_csv, scan_type="T1w", num_slices=10):
+def _init_worker():
+    """
+    Keep each worker process single-threaded (BLAS/OpenMP and Numba), since
+    the pool already runs one scan per core.
+    """
+    os.environ["OMP_NUM_THREADS"] = "1"
+    set_num_threads(1)
+
+def traverse_bids_final(bids_root, accepted_csv, scan_type="T1w", num_slices=10, num_workers=None,
+                        docker_ready=None, force=False):
     """
     Only process scans that appear in accepted_csv. 
+    Scans are independent, so they are processed in parallel across
+    num_workers processes (default: one per CPU).
+    docker_ready is the result of an earlier ensure_docker_image() call;
+    if None, the image is checked here, once, only when something needs stripping.
+    Scans with all outputs already present are skipped unless force is set.
     """
     logger.info(f"[Final QC] Starting traversal of {bids_root} for scan type {scan_type}...")
 
     # 1) Load accepted subject/session IDs into a set
     accepted = load_accepted_csv(accepted_csv)
 
-    for root, dirs, files in os.walk(bids_root):
-        if "results" in root:
-            continue
-
-        for fname in files:
-            if (fname.endswith(".nii") or fname.endswith(".nii.gz")) and (scan_type in fname):
-                # Check if sub/ses is in the accepted set
-                # We'll parse sub-XXXX_ses-YYYY from the fname or from the path
-                # This depends on your naming. Example approach:
-                fullpath = os.path.join(root, fname)
-                sub_ses_key = extract_sub_ses(fullpath)
+    filepaths = find_accepted_scans(bids_root, accepted, scan_type)
+    if not force:
+        pending = [fp for fp in filepaths
+                   if not all(os.path.exists(p) for p in final_outputs(bids_root, fp))]
+        if len(pending) < len(filepaths):
+            logger.info(f"[Final QC] Skipping {len(filepaths) - len(pending)} scan(s) with existing outputs.")
+        filepaths = pending
+
+    # 2) Skull-strip everything that still needs it in one container
+    to_strip = [fp for fp in filepaths if not os.path.exists(_stripped_path(fp))]
+    if to_strip:
+        if docker_ready is None:
+            docker_ready = ensure_docker_image()
+        if docker_ready:
+            process_skull_stripping_batch(to_strip)
+        else:
+            logger.error("Could not ensure Docker image availability. Skipping batch skull stripping.")
 
-                if sub_ses_key in accepted:
-                    process_scan_final(bids_root, fullpath, num_slices=num_slices)
-                else:
-                    logger.info(f"Skipping {fullpath} (not in accepted list).")
+    # 3) Process the accepted scans in parallel
+    with ProcessPoolExecutor(max_workers=num_workers or os.cpu_count(), initializer=_init_worker) as ex:
+        list(ex.map(process_scan_final, repeat(bids_root), filepaths, repeat(num_slices),
+                    repeat(bool(docker_ready)), repeat(force)))
 
     logger.info("[Final QC] Finished processing all files.")
 
+def find_accepted_scans(bids_root, accepted, scan_type):
+    """
+    Collect the scan files belonging to the accepted (sub, ses) pairs.
+
+    Each pair's anat directory (sub/ses/anat, or sub/anat for the default
+    ses-01 of session-less datasets) is listed directly with os.scandir, so
+    the rest of the tree is never touched. Pairs without such a directory
+    fall back to one os.walk of the tree, with results/ pruned.
+    """
+    filepaths = []
+    missing = set()
+    for key in sorted(accepted):
+        sub, ses = key
+        anat_dirs = [os.path.join(bids_root, sub, ses, "anat")]
+        if ses == "ses-01":
+            anat_dirs.append(os.path.join(bids_root, sub, "anat"))
+
+        found_dir = False
+        for anat_dir in anat_dirs:
+            try:
+                with os.scandir(anat_dir) as it:
+                    names = sorted(entry.name for entry in it if not entry.is_dir())
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            found_dir = True
+            for fname in names:
+                if (fname.endswith(NIFTI_EXTS) and scan_type in fname
+                        and not fname.endswith(STRIPPED_SUFFIX) and extract_sub_ses(fname) == key):
+                    filepaths.append(os.path.join(anat_dir, fname))
+        if not found_dir:
+            missing.add(key)
+
+    if missing:
+        logger.info(f"{len(missing)} accepted subject/session(s) have no anat directory; searching {bids_root}.")
+        for root, dirs, files in os.walk(bids_root):
+            dirs[:] = [d for d in dirs if "results" not in d]
+
+            for fname in files:
+                if fname.endswith(NIFTI_EXTS) and scan_type in fname and not fname.endswith(STRIPPED_SUFFIX):
+                    fullpath = os.path.join(root, fname)
+                    sub_ses_key = extract_sub_ses(fullpath)
+
+                    if sub_ses_key in missing:
+                        filepaths.append(fullpath)
+                    elif sub_ses_key not in accepted:
+                        logger.info(f"Skipping {fullpath} (not in accepted list).")
+
+    return filepaths
+
 def load_accepted_csv(csv_path):
     """
     CSV with lines like:
@@ -292,11 +650,9 @@ def load_accepted_csv(csv_path):
        sub-002, ses-02
     Returns a set of (sub-001, ses-01), ...
     """
-    df = pd.read_csv(csv_path)
-    accepted_set = set()
-    for _, row in df.iterrows():
-        accepted_set.add((row['subject_id'], row['session_id']))
-    return accepted_set
+    with open(csv_path, newline='') as f:
+        reader = csv.DictReader(f, skipinitialspace=True)
+        return {(row['subject_id'].strip(), row['session_id'].strip()) for row in reader}
 
 def extract_sub_ses(filepath):
     """
@@ -306,9 +662,7 @@ def extract_sub_ses(filepath):
     basename = os.path.basename(filepath)
     # For instance, you can do:
     # sub-1234_ses-2_T1w.nii.gz -> (sub-1234, ses-2)
-    import re
-    pattern = re.compile(r'(sub-\d+)_?(ses-\d+)?')
-    m = pattern.search(basename)
+    m = _SUB_SES_RE.search(basename)
     if m:
         sub_id = m.group(1)
         ses_id = m.group(2) or 'ses-01'
@@ -325,6 +679,16 @@ def main():
     parser.add_argument("scan_type", help="Scan type substring to match, e.g. T1w or T2w")
     parser.add_argument("--num_slices", type=int, default=10, 
                         help="Number of slices to display (default: 10)")
+    parser.add_argument("--num_workers", type=int, default=None,
+                        help="Number of scans to process in parallel (default: number of CPUs)")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocess scans whose outputs already exist")
     args = parser.parse_args()
 
-    traverse_bids_final(args.bids_root, args.accepted_csv, scan_type=args.scan_type, num_slices=args.num_slices)
\ No newline at end of file
+    # Check (and if needed pull) the SynthStrip image once, before any workers start
+    docker_ready = ensure_docker_image()
+    if not docker_ready:
+        logger.error("Could not ensure Docker image availability. Only scans already skull-stripped will be processed.")
+
+    traverse_bids_final(args.bids_root, args.accepted_csv, scan_type=args.scan_type, num_slices=args.num_slices,
+                        num_workers=args.num_workers, docker_ready=docker_ready, force=args.force)
\ No newline at end of file
@@ -2,18 +2,48 @@ import os
 import sys
 import logging
 import argparse
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import nibabel as nib
-import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # headless: scans may be processed in worker processes
 import matplotlib.pyplot as plt
-import seaborn as sns
+from numba import njit, prange, set_num_threads
 
 logger = logging.getLogger(__name__)
 
+DENSITY_BINS = 256  # histogram bins for the density plot
+DENSITY_SMOOTH = 2.0  # Gaussian smoothing of the histogram, in bins
+NIFTI_EXTS = (".nii", ".nii.gz")
+STRIPPED_SUFFIX = "_skullstripped.nii.gz"  # final-QC output written next to the scan
+_RESULTS_DIRS = {}  # (bids_root, scan dir) -> results dir already created
 
-def find_slices_of_interest(data, num_slices=10):
-    slice_sums = np.sum(data, axis=(0, 1))
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _slice_sums(vol, out):
+    # One prange task per axial slice; x innermost follows NIfTI's Fortran order
+    nx, ny, nz = vol.shape
+    for z in prange(nz):
+        s = out[z]
+        for y in range(ny):
+            for x in range(nx):
+                s += vol[x, y, z]
+        out[z] = s
+    return out
+
+def find_slices_of_interest(data, num_slices=10, slope=1.0):
+    if data.dtype.kind in "iubf":
+        acc = np.float64 if data.dtype.kind == "f" else np.int64
+        # Numba only types native byte order; big-endian files need a swapped copy
+        data = np.asarray(data)
+        data = data.astype(data.dtype.newbyteorder('='), copy=False)
+        slice_sums = _slice_sums(data, np.zeros(data.shape[2], dtype=acc))
+    else:
+        slice_sums = np.add.reduce(data, axis=(0, 1))
+    if slope < 0:
+        slice_sums = -slice_sums
     best_idx = np.argmax(slice_sums)
     margin = num_slices * 5
     zsize = data.shape[2]
@@ -22,51 +52,169 @@ def find_slices_of_interest(data, num_slices=10):
     slice_indices = np.linspace(start_idx, end_idx, num_slices, dtype=int)
     return np.unique(slice_indices)
 
-def plot_slices(data, slice_indices, output_path, title="", nrows=5, ncols=2):
-    fig, axes = plt.subplots(nrows=nrows, ncols=ncols, figsize=(4*ncols, 4*nrows))
-    for i, ax in enumerate(axes.flat):
-        if i < len(slice_indices):
-            idx = slice_indices[i]
-            slice_data = data[:, :, idx].T
-            ax.imshow(np.flipud(slice_data), cmap='gray', origin='lower')
-            ax.set_title(f"Slice {idx}")
-            ax.axis('off')
+_PLOT_CACHE = {}  # (nrows, ncols) -> (fig, ax, image, labels), reused across scans
+
+SUBPLOT_DEFAULTS = {k: plt.rcParams[f"figure.subplot.{k}"]
+                    for k in ("left", "right", "bottom", "top", "wspace", "hspace")}
+
+def _slice_figure(nrows, ncols):
+    cached = _PLOT_CACHE.get((nrows, ncols))
+    if cached is None:
+        fig, ax = plt.subplots(figsize=(4*ncols, 4*nrows))
+        image = ax.imshow(np.zeros((1, 1)), cmap='gray', vmin=0.0, vmax=1.0)
+        labels = [ax.text(0, 0, "", ha='center', va='center') for _ in range(nrows * ncols)]
+        ax.axis('off')
+        cached = _PLOT_CACHE[(nrows, ncols)] = (fig, ax, image, labels)
+    return cached
+
+def slice_mosaic(data, slice_indices, nrows, ncols):
+    # Tile the slices row-major into one array; NaN cells render blank.
+    # Each tile gets a label band above it and is scaled to its own range.
+    height, width = data.shape[1], data.shape[0]
+    band, gap = max(8, height // 8), max(4, width // 16)
+    cell_h, cell_w = height + band, width + gap
+    mosaic = np.full((nrows * cell_h, ncols * cell_w - gap), np.nan, dtype=np.float32)
+    centers = []
+    for k, idx in enumerate(slice_indices[:nrows * ncols]):
+        tile = data[:, :, idx].T
+        lo, hi = np.nanmin(tile), np.nanmax(tile)
+        r, c = divmod(k, ncols)
+        y, x = r * cell_h + band, c * cell_w
+        out = mosaic[y:y + height, x:x + width]
+        if hi > lo:
+            np.subtract(tile, lo, out=out)
+            out /= hi - lo
         else:
-            ax.axis('off')
-    plt.suptitle(title)
-    plt.tight_layout()
-    plt.savefig(output_path, format='png', bbox_inches='tight')
-    plt.close(fig)
+            out[:] = 0.0
+        centers.append((x + (width - 1) / 2, y - band / 2))
+    return mosaic, centers
 
-def ensure_results_dir(bids_root, filepath):
+def plot_slices(data, slice_indices, output_path, title="", nrows=5, ncols=2):
+    fig, ax, image, labels = _slice_figure(nrows, ncols)
+    mosaic, centers = slice_mosaic(data, slice_indices, nrows, ncols)
+    h, w = mosaic.shape
+    # Match the figure to the mosaic's aspect (plus room for the title) so the
+    # saved PNG has no empty margins to trim
+    fig.set_size_inches(4*ncols, 4*ncols * h / w + 0.5)
+    image.set_data(mosaic)
+    image.set_extent((-0.5, w - 0.5, h - 0.5, -0.5))
+    ax.set_xlim(-0.5, w - 0.5)
+    ax.set_ylim(h - 0.5, -0.5)
+    for label, idx, xy in zip(labels, slice_indices, centers):
+        label.set_position(xy)
+        label.set_text(f"Slice {idx}")
+    for label in labels[len(centers):]:
+        label.set_text("")
+    fig.suptitle(title)
+    # tight_layout starts from the current subplot params, so reset them first
+    fig.subplots_adjust(**SUBPLOT_DEFAULTS)
+    fig.tight_layout()
+    # tight_layout already fits the margins, so skip bbox_inches='tight' (a second
+    # render pass); zlib level 1 is much cheaper than the default 6 for these previews
+    fig.savefig(output_path, format='png', dpi=90, pil_kwargs={'compress_level': 1})
+
+def results_dir_for(bids_root, filepath):
     rel_path = os.path.relpath(os.path.dirname(filepath), bids_root)
-    results_dir = os.path.join(bids_root, "results", rel_path)
-    os.makedirs(results_dir, exist_ok=True)
+    return os.path.join(bids_root, "results", rel_path)
+
+def ensure_results_dir(bids_root, filepath):
+    # makedirs once per directory, not once per scan
+    key = (bids_root, os.path.dirname(filepath))
+    results_dir = _RESULTS_DIRS.get(key)
+    if results_dir is None:
+        results_dir = results_dir_for(bids_root, filepath)
+        os.makedirs(results_dir, exist_ok=True)
+        _RESULTS_DIRS[key] = results_dir
     return results_dir
 
+@njit(parallel=True, cache=True)
+def _fused_moments(flat):
+    total = 0.0
+    total_sq = 0.0
+    lo = np.inf
+    hi = -np.inf
+    for i in prange(flat.size):
+        v = float(flat[i])
+        total += v
+        total_sq += v * v
+        lo = min(lo, v)
+        hi = max(hi, v)
+    return total, total_sq, lo, hi
+
+def _median(flat):
+    n = flat.size
+    k = n // 2
+    if n % 2:
+        return np.partition(flat, k)[k]
+    part = np.partition(flat, [k - 1, k])
+    return (float(part[k - 1]) + float(part[k])) / 2.0
+
+def _stats_from_array(data):
+    flat = data.ravel(order='K')
+    total, total_sq, lo, hi = _fused_moments(flat)
+    if np.isnan(total) and np.isnan(flat).any():
+        # min/max skip NaN and partition sorts it last; NumPy would give NaN throughout
+        return dict.fromkeys(('mean', 'median', 'max', 'min', 'std'), float('nan'))
+    n = flat.size
+    mean = total / n
+    return {
+        'mean': float(mean),
+        'median': float(_median(flat)),
+        'max': float(hi),
+        'min': float(lo),
+        'std': float(np.sqrt(max(total_sq / n - mean * mean, 0.0)))
+    }
+
+def load_volume(img):
+    # Read the voxels once: native dtype for slice selection, scaled float32 for the rest
+    dataobj = img.dataobj
+    if not hasattr(dataobj, "get_unscaled"):
+        data = np.asarray(dataobj, dtype=np.float32)
+        return data, 1.0, data
+    raw = np.asanyarray(dataobj.get_unscaled())
+    slope, inter = float(dataobj.slope), float(dataobj.inter)
+    data = raw.astype(np.float32)
+    if slope != 1.0:
+        data *= np.float32(slope)
+    if inter != 0.0:
+        data += np.float32(inter)
+    return raw, slope, data
+
 def analyze_nifti(filepath):
     try:
-        img = nib.load(filepath)
-        data = img.get_fdata()
-        return {
-            'mean': float(np.mean(data)),
-            'median': float(np.median(data)),
-            'max': float(np.max(data)),
-            'min': float(np.min(data)),
-            'std': float(np.std(data))
-        }
+        img = nib.load(filepath, mmap=False)
+        return _stats_from_array(np.asarray(img.dataobj, dtype=np.float32))
     except Exception as e:
         logger.error(f"analyze_nifti failed for {filepath}: {str(e)}")
         return {}
 
+def write_stats_csv(path, stats):
+    with open(path, 'w') as f:
+        f.write(",".join(stats) + "\n")
+        # NaN is written as an empty field, as DataFrame.to_csv did
+        f.write(",".join("" if v != v else str(v) for v in stats.values()) + "\n")
+
 def create_density_plot_and_save(data, output_path, title=""):
-    plt.figure(figsize=(10, 6))
-    sns.kdeplot(data=data.flatten(), fill=False)
-    plt.title(title)
-    plt.xlabel("Image Intensity")
-    plt.ylabel("Density")
-    plt.savefig(output_path, format='svg', bbox_inches='tight')
-    plt.close()
+    flat = data.ravel()
+    lo, hi = float(flat.min()), float(flat.max())
+    if not (np.isfinite(lo) and np.isfinite(hi)):
+        flat = flat[np.isfinite(flat)]
+        lo, hi = (float(flat.min()), float(flat.max())) if flat.size else (0.0, 1.0)
+    counts, edges = np.histogram(flat, bins=DENSITY_BINS, range=(lo, hi))
+    density = counts / max(counts.sum(), 1) / np.diff(edges)
+    # A small Gaussian kernel smooths the histogram into a KDE-like curve
+    offsets = np.arange(-3 * DENSITY_SMOOTH, 3 * DENSITY_SMOOTH + 1)
+    kernel = np.exp(-0.5 * (offsets / DENSITY_SMOOTH) ** 2)
+    density = np.convolve(density, kernel / kernel.sum(), mode='same')
+    centers = 0.5 * (edges[:-1] + edges[1:])
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.plot(centers, density)
+    ax.set_title(title)
+    ax.set_xlabel("Image Intensity")
+    ax.set_ylabel("Density")
+    fig.savefig(output_path, format='svg', bbox_inches='tight')
+    plt.close(fig)
 
 def strip_nii_gz(basename):
     if basename.endswith(".nii.gz"):
@@ -78,31 +226,40 @@ def strip_nii_gz(basename):
     else:
         return basename
 
-def process_scan_initial(bids_root, filepath, num_slices=10):
+def process_scan_initial(bids_root, filepath, num_slices=10, force=False):
     # Grab just the filename (no directory)
     filename = os.path.basename(filepath)
     # Now remove .nii or .nii.gz, if present
     base_no_ext = strip_nii_gz(filename)
+
+    # Skip scans already processed by an earlier run, unless forced
+    results_dir = results_dir_for(bids_root, filepath)
+    outputs = [os.path.join(results_dir, f"{base_no_ext}{suffix}")
+               for suffix in ("_original_slices.png", "_stats.csv", "_density.svg")]
+    if not force and all(os.path.exists(p) for p in outputs):
+        logger.info(f"[Initial QC] Outputs for {filepath} already exist, skipping.")
+        return
     
     logger.info(f"[Initial QC] Processing {filepath} ...")
 
     # 1) Load original data
-    img = nib.load(filepath)
-    data = img.get_fdata()
-    
+    # mmap=False reads a .nii straight into memory instead of faulting pages in
+    raw, slope, data = load_volume(nib.load(filepath, mmap=False))
+
     # 2) Find slices of interest
-    slice_indices = find_slices_of_interest(data, num_slices=num_slices)
+    slice_indices = find_slices_of_interest(raw, num_slices=num_slices, slope=slope)
+    del raw
 
     # 3) Plot & save to results folder
     results_dir = ensure_results_dir(bids_root, filepath)
     original_png = os.path.join(results_dir, f"{base_no_ext}_original_slices.png")
     plot_slices(data, slice_indices, original_png, title=f"{base_no_ext} - Original", nrows=2, ncols=5)
 
-    # 4) Stats & density
-    intensity_stats = analyze_nifti(filepath)
+    # 4) Stats & density (reusing the volume loaded above)
+    intensity_stats = _stats_from_array(data)
     if intensity_stats:
         stats_csv_path = os.path.join(results_dir, f"{base_no_ext}_stats.csv")
-        pd.DataFrame([intensity_stats]).to_csv(stats_csv_path, index=False)
+        write_stats_csv(stats_csv_path, intensity_stats)
 
         density_svg_path = os.path.join(results_dir, f"{base_no_ext}_density.svg")
         create_density_plot_and_save(
@@ -113,21 +270,31 @@ def process_scan_initial(bids_root, filepath, num_slices=10):
 
     logger.info(f"[Initial QC] Finished processing {filepath}.\n")
 
-def traverse_bids_initial(bids_root, scan_type="T1w", num_slices=10):
+def _init_worker():
+    # One thread per worker process; the pool already uses every core
+    os.environ["OMP_NUM_THREADS"] = "1"
+    set_num_threads(1)
+
+def traverse_bids_initial(bids_root, scan_type="T1w", num_slices=10, num_workers=None, force=False):
     """
     Only processes original data. 
+    Scans are independent, so they are processed in parallel across
+    num_workers processes (default: one per CPU).
     """
     logger.info(f"[Initial QC] Starting traversal of {bids_root} for scan type {scan_type}...")
 
+    filepaths = []
     for root, dirs, files in os.walk(bids_root):
         if "results" in root:
             continue
 
         for fname in files:
             # Only proceed if it matches the scan type, e.g. T1w
-            if (fname.endswith(".nii") or fname.endswith(".nii.gz")) and (scan_type in fname):
-                fullpath = os.path.join(root, fname)
-                process_scan_initial(bids_root, fullpath, num_slices=num_slices)
+            if fname.endswith(NIFTI_EXTS) and scan_type in fname and not fname.endswith(STRIPPED_SUFFIX):
+                filepaths.append(os.path.join(root, fname))
+
+    with ProcessPoolExecutor(max_workers=num_workers or os.cpu_count(), initializer=_init_worker) as ex:
+        list(ex.map(process_scan_initial, repeat(bids_root), filepaths, repeat(num_slices), repeat(force)))
 
     logger.info("[Initial QC] Finished processing all files.")
 
@@ -139,6 +306,11 @@ def main():
     parser.add_argument("scan_type", help="Scan type substring to match, e.g. T1w or T2w")
     parser.add_argument("--num_slices", type=int, default=10, 
                         help="Number of slices to display (default: 10)")
+    parser.add_argument("--num_workers", type=int, default=None,
+                        help="Number of scans to process in parallel (default: number of CPUs)")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocess scans whose outputs already exist")
     args = parser.parse_args()
 
-    traverse_bids_initial(args.bids_root, scan_type=args.scan_type, num_slices=args.num_slices)
\ No newline at end of file
+    traverse_bids_initial(args.bids_root, scan_type=args.scan_type, num_slices=args.num_slices,
+                          num_workers=args.num_workers, force=args.force)
\ No newline at end of file
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 import os
-import re
+import csv
 import argparse
+from functools import lru_cache
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 def main():
     """
@@ -14,11 +17,234 @@ def main():
     parser.add_argument("root_dir", help="Top-level directory of results (usually BIDS_ROOT/results).")
     parser.add_argument("--phase", choices=["initial", "final"], default="initial",
                         help="Specify 'initial' or 'final' (optional). Affects HTML filename & header.")
+    parser.add_argument("--stat-threads", type=int, default=16,
+                        help="Number of directories to scan concurrently (default: 16).")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Print every directory visited during the walk.")
     args = parser.parse_args()
 
-    generate_html_reports(args.root_dir, phase=args.phase)
+    generate_html_reports(args.root_dir, phase=args.phase, stat_threads=args.stat_threads,
+                          verbose=args.verbose)
 
-def generate_html_reports(root_dir, phase="initial"):
+# Per-report page: HTML with annotation tool + Good/Bad classification.
+# Filled with str.format; styling and script live in the shared assets below.
+_REPORT_TMPL = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8" />
+    <title>{subject} {session} Report ({phase})</title>
+    <link rel="stylesheet" type="text/css" href="{css_href}" />
+    <script src="{js_href}"></script>
+</head>
+<body data-subject="{subject}" data-session="{session}" data-phase="{phase}">
+
+    <!-- Navigation -->
+    <div class="nav">
+        {prev_link} {next_link}
+    </div>
+
+    <h2>Subject: {subject} | Session: {session} | Phase: {phase}</h2>
+
+    <div class="qc-buttons">
+        <button onclick="markQC('GOOD')">Mark Good</button>
+        <button onclick="markQC('BAD')">Mark Bad</button>
+        <button onclick="markQC('UNCLEAR')">Mark Unclear</button>
+        <span class="qc-status" id="qcStatusDisplay">Status: UNKNOWN</span>
+        <label for="qcNotes" style="margin-left: 20px;">Notes:</label>
+        <input type="text" id="qcNotes" style="width: 200px; margin-left: 5px; padding: 5px;" onchange="saveNotes()" placeholder="Add notes here..."/>
+    </div>
+
+    <div class="section">
+        {orig_png}
+    </div>
+
+    <div class="section">
+        {strip_png}
+    </div>
+
+    <div class="section">
+        {dens_svg}
+    </div>
+
+    <div class="section">
+        {stats_tbl}
+    </div>
+
+</body>
+</html>"""
+
+# Shared page stylesheet, written once as <root_dir>/qc_report.css
+REPORT_CSS_NAME = "qc_report.css"
+_REPORT_CSS = """body {
+    font-family: Arial, sans-serif;
+    margin: 20px;
+}
+.nav {
+    margin-bottom: 20px;
+}
+.nav span, .nav a {
+    margin-right: 20px;
+    font-weight: bold;
+}
+.section {
+    margin-bottom: 30px;
+}
+.png-image, .svg-image {
+    max-width: 90%;
+    border: 1px solid #ccc;
+    margin-bottom: 10px;
+    display: block;
+    position: relative;
+}
+.stats-table {
+    border-collapse: collapse;
+    margin-top: 10px;
+}
+.stats-table td, .stats-table th {
+    border: 1px solid #999;
+    padding: 6px 10px;
+}
+/* Annotation canvas overlay */
+.annotation-container {
+    position: relative;
+    display: inline-block;
+}
+.annot-canvas {
+    position: absolute;
+    top: 0;
+    left: 0;
+    border: 1px solid #ccc;
+    opacity: 0.6;  /* Adjust transparency as needed */
+}
+.qc-buttons {
+    margin: 20px 0;
+}
+.qc-buttons button {
+    margin-right: 10px;
+    padding: 8px 12px;
+    font-size: 14px;
+    cursor: pointer;
+}
+.qc-status {
+    font-weight: bold;
+    margin-left: 20px;
+}
+"""
+
+# Shared page script, written once as <root_dir>/qc_report.js and loaded by
+# every report (annotation canvas, Good/Bad/Unclear status, notes).
+REPORT_JS_NAME = "qc_report.js"
+_REPORT_JS = """// Canvas sizing for the annotation overlays. This file is loaded from <head>
+// so the <img>/<object> onload handlers can call these as soon as they fire.
+function resizeCanvas(imgElem) {
+    let canvas = imgElem.parentNode.querySelector('.annot-canvas');
+    if (canvas) {
+        canvas.width = imgElem.width;
+        canvas.height = imgElem.height;
+    }
+}
+
+// Rough approach to resizing the canvas after the SVG loads
+function resizeSvgCanvas(objElem) {
+    let canvas = objElem.parentNode.querySelector('.annot-canvas');
+    if (canvas) {
+        // We can't easily get the rendered width/height of an <object> with an SVG,
+        // so you might want a more robust approach or fixed size.
+        canvas.width = 600;
+        canvas.height = 400;
+    }
+}
+
+// Subject, session and phase come from data-* attributes on <body>.
+
+// For each annotation container:
+// We attach an event listener to the canvas to allow freehand drawing.
+document.addEventListener('DOMContentLoaded', function() {
+    const containers = document.querySelectorAll('.annotation-container');
+    containers.forEach(container => {
+        const canvas = container.querySelector('.annot-canvas');
+        if (!canvas) return;
+
+        const ctx = canvas.getContext('2d');
+        let drawing = false;
+
+        function startDraw(e) {
+            drawing = true;
+            ctx.beginPath();
+            ctx.moveTo(e.offsetX, e.offsetY);
+        }
+        function draw(e) {
+            if (!drawing) return;
+            ctx.lineWidth = 2;
+            ctx.lineCap = 'round';
+            ctx.strokeStyle = 'red';
+            ctx.lineTo(e.offsetX, e.offsetY);
+            ctx.stroke();
+        }
+        function endDraw(e) {
+            drawing = false;
+        }
+
+        canvas.addEventListener('mousedown', startDraw);
+        canvas.addEventListener('mousemove', draw);
+        canvas.addEventListener('mouseup', endDraw);
+        canvas.addEventListener('mouseleave', endDraw);
+    });
+
+    // On load, retrieve stored QC status and notes from localStorage
+    loadQCStatus();
+    loadNotes();
+});
+
+// Store Good/Bad/Unclear decision in localStorage
+function markQC(status) {
+    const subject = document.body.dataset.subject;
+    const session = document.body.dataset.session;
+    const phase   = document.body.dataset.phase;
+    const key = `QC_${subject}_${session}_${phase}`;
+    localStorage.setItem(key, status);
+    document.getElementById('qcStatusDisplay').innerHTML = `Status: ${status}`;
+    
+    // Save notes along with the status
+    saveNotes();
+}
+
+// Save notes to localStorage
+function saveNotes() {
+    const subject = document.body.dataset.subject;
+    const session = document.body.dataset.session;
+    const phase   = document.body.dataset.phase;
+    const notes = document.getElementById('qcNotes').value;
+    const notesKey = `QC_NOTES_${subject}_${session}_${phase}`;
+    localStorage.setItem(notesKey, notes);
+}
+
+// On page load, display the previously selected QC status
+function loadQCStatus() {
+    const subject = document.body.dataset.subject;
+    const session = document.body.dataset.session;
+    const phase   = document.body.dataset.phase;
+    const key = `QC_${subject}_${session}_${phase}`;
+    const storedValue = localStorage.getItem(key);
+    if (storedValue) {
+        document.getElementById('qcStatusDisplay').innerHTML = `Status: ${storedValue}`;
+    }
+}
+
+// On page load, load any previously saved notes
+function loadNotes() {
+    const subject = document.body.dataset.subject;
+    const session = document.body.dataset.session;
+    const phase   = document.body.dataset.phase;
+    const notesKey = `QC_NOTES_${subject}_${session}_${phase}`;
+    const storedNotes = localStorage.getItem(notesKey);
+    if (storedNotes) {
+        document.getElementById('qcNotes').value = storedNotes;
+    }
+}
+"""
+
+def generate_html_reports(root_dir, phase="initial", stat_threads=16, verbose=False):
     """
     root_dir: The top-level directory containing 'sub-XXXX' folders (with results).
     Walk the directory tree to find:
@@ -30,54 +256,71 @@ def generate_html_reports(root_dir, phase="initial"):
     Then produce an HTML report for each (sub, ses).
     If phase='initial', we name the report "sub-XXX_ses-YYY_T1w_report_initial.html"
     If phase='final', we name it "sub-XXX_ses-YYY_T1w_report_final.html"
+
+    Each top-level directory is scanned in its own thread (stat_threads at a
+    time) so directory-listing latency overlaps; the results are merged in
+    listing order, exactly as a sequential walk would see them. Only sub-*
+    directories are entered at the top level; below that, hidden directories
+    and those named in SKIP_DIRS are pruned. Reports are then rendered and
+    written on a thread pool (one worker per CPU); the stylesheet and script
+    they all load are written once to root_dir/qc_report.css and .js.
+    Each visited directory is only printed when verbose is set.
     """
-    data_map = {}
-    pattern = re.compile(r'(sub-\d+)_?(ses-\d+)?')
+    # One slot per (subject, session), in first-seen order, held as parallel
+    # lists; index_of maps each key to its slot.
+    index_of = {}
+    keys = []
+    dirs = []
+    orig_files = []
+    strip_files = []
+    dens_files = []
+    stats_files = []
     print(f"Walking {root_dir}")
-    for dirpath, _, filenames in os.walk(root_dir):
-        print(f"Walking {dirpath}")
-        orig_file = None
-        strip_file = None
-        dens_file = None
-        stats_file = None
-
-        for fname in filenames:
-            fullpath = os.path.join(dirpath, fname)
-            if fname.endswith('_original_slices.png'):
-                orig_file = fullpath
-            elif fname.endswith('_skullstripped_slices.png'):
-                strip_file = fullpath
-            elif fname.endswith('_density.svg'):
-                dens_file = fullpath
-            elif fname.endswith('_stats.csv'):
-                stats_file = fullpath
+    records = []
+    try:
+        with os.scandir(root_dir) as it:
+            top_entries = list(it)
+    except OSError:
+        top_entries = None
+    if top_entries is not None:
+        records.append((root_dir,) + match_report_files(e for e in top_entries if not e.is_dir()))
+        # Per-subject outputs only live under sub-* at the top level
+        subdirs = [e.path for e in top_entries
+                   if e.name.startswith('sub-') and e.is_dir() and not e.is_symlink()]
+        with ThreadPoolExecutor(max_workers=max(1, stat_threads)) as ex:
+            for fragment in ex.map(scan_tree, subdirs):
+                records.extend(fragment)
+
+    for dirpath, orig_file, strip_file, dens_file, stats_file in records:
+        if verbose:
+            print(f"Walking {dirpath}")
 
         # If at least one relevant file was found, figure out subject/session
         candidate_file = orig_file or strip_file or dens_file or stats_file
         if candidate_file:
-            match = pattern.search(os.path.basename(candidate_file))
-            if match:
-                subject = match.group(1)  # e.g. sub-002081
-                session = match.group(2) if match.group(2) else 'ses-01'
+            parsed = parse_sub_ses(candidate_file[1])
+            if parsed:
+                subject, session = parsed  # e.g. sub-002081, ses-01
 
                 key = (subject, session)
-                if key not in data_map:
-                    data_map[key] = {
-                        "orig": None,
-                        "strip": None,
-                        "dens": None,
-                        "stats": None,
-                        "directory": dirpath
-                    }
+                idx = index_of.get(key)
+                if idx is None:
+                    idx = index_of[key] = len(keys)
+                    keys.append(key)
+                    dirs.append(dirpath)
+                    orig_files.append(None)
+                    strip_files.append(None)
+                    dens_files.append(None)
+                    stats_files.append(None)
 
                 if orig_file:
-                    data_map[key]["orig"] = orig_file
+                    orig_files[idx] = orig_file
                 if strip_file:
-                    data_map[key]["strip"] = strip_file
+                    strip_files[idx] = strip_file
                 if dens_file:
-                    data_map[key]["dens"] = dens_file
+                    dens_files[idx] = dens_file
                 if stats_file:
-                    data_map[key]["stats"] = stats_file
+                    stats_files[idx] = stats_file
 
     # Sort the (subject, session) keys by numeric value
     def numeric_sort_key(k):
@@ -89,271 +332,283 @@ def generate_html_reports(root_dir, phase="initial"):
             ses_num = int(ses_str.replace('ses-', ''))
         return (sub_num, ses_num)
 
-    sorted_keys = sorted(data_map.keys(), key=numeric_sort_key)
+    order = numeric_order([numeric_sort_key(k) for k in keys])
+    keys = [keys[idx] for idx in order]
+    report_files = tuple([files[idx] for idx in order]
+                         for files in (orig_files, strip_files, dens_files, stats_files))
 
-    key_html_paths = []
-    for key in sorted_keys:
-        subject, session = key
-        out_dir = data_map[key]["directory"]
+    html_paths = []
+    for idx, (subject, session) in zip(order, keys):
+        out_dir = dirs[idx]
         # Differentiate the HTML name by phase
         report_name = f"{subject}_{session}_T1w_report_{phase}.html"
         if session == 'ses-01':
             # In case session is missing in the filename, do what you need
             report_name = f"{subject}_T1w_report_{phase}.html"
-        html_path = os.path.join(out_dir, report_name)
-        key_html_paths.append((key, html_path))
-    print(f"Generated {len(key_html_paths)} HTML reports")
-    for i, (key, html_path) in enumerate(key_html_paths):
-        subject, session = key
-        files_info = data_map[key]
-
-        # Build Prev/Next links
-        if i > 0:
-            _, prev_html = key_html_paths[i-1]
-            rel_prev = os.path.relpath(prev_html, os.path.dirname(html_path))
-            prev_link = f'<a href="{rel_prev}">Previous</a>'
-        else:
-            prev_link = '<span style="color:gray;">Previous</span>'
-
-        if i < len(key_html_paths) - 1:
-            _, next_html = key_html_paths[i+1]
-            rel_next = os.path.relpath(next_html, os.path.dirname(html_path))
-            next_link = f'<a href="{rel_next}">Next</a>'
-        else:
-            next_link = '<span style="color:gray;">Next</span>'
-
-        # Prepare embedded blocks
-        orig_png  = embed_png(files_info["orig"],  "Original Slices")       if files_info["orig"]  else not_found("Original Slices")
-        strip_png = embed_png(files_info["strip"], "Skull-Stripped Slices") if files_info["strip"] else not_found("Skull-Stripped Slices")
-        dens_svg  = embed_svg(files_info["dens"],  "Density Plot")          if files_info["dens"]  else not_found("Density Plot")
-        stats_tbl = embed_stats(files_info["stats"])                        if files_info["stats"] else not_found("Stats")
-
-        # Assemble HTML with annotation tool + Good/Bad classification
-        html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8" />
-    <title>{subject} {session} Report ({phase})</title>
-    <style>
-        body {{
-            font-family: Arial, sans-serif;
-            margin: 20px;
-        }}
-        .nav {{
-            margin-bottom: 20px;
-        }}
-        .nav span, .nav a {{
-            margin-right: 20px;
-            font-weight: bold;
-        }}
-        .section {{
-            margin-bottom: 30px;
-        }}
-        .png-image, .svg-image {{
-            max-width: 90%;
-            border: 1px solid #ccc;
-            margin-bottom: 10px;
-            display: block;
-            position: relative;
-        }}
-        .stats-table {{
-            border-collapse: collapse;
-            margin-top: 10px;
-        }}
-        .stats-table td, .stats-table th {{
-            border: 1px solid #999;
-            padding: 6px 10px;
-        }}
-        /* Annotation canvas overlay */
-        .annotation-container {{
-            position: relative;
-            display: inline-block;
-        }}
-        .annot-canvas {{
-            position: absolute;
-            top: 0;
-            left: 0;
-            border: 1px solid #ccc;
-            opacity: 0.6;  /* Adjust transparency as needed */
-        }}
-        .qc-buttons {{
-            margin: 20px 0;
-        }}
-        .qc-buttons button {{
-            margin-right: 10px;
-            padding: 8px 12px;
-            font-size: 14px;
-            cursor: pointer;
-        }}
-        .qc-status {{
-            font-weight: bold;
-            margin-left: 20px;
-        }}
-    </style>
-</head>
-<body>
-
-    <!-- Navigation -->
-    <div class="nav">
-        {prev_link} {next_link}
-    </div>
+        html_paths.append(os.path.join(out_dir, report_name))
+    print(f"Generated {len(html_paths)} HTML reports")
+    # Spelled like the walk's directories so links to it take the fast paths
+    asset_dir = os.path.dirname(os.path.join(root_dir, REPORT_JS_NAME))
+    if html_paths:
+        write_bytes(os.path.join(asset_dir, REPORT_CSS_NAME), _REPORT_CSS.encode('utf-8'))
+        write_bytes(os.path.join(asset_dir, REPORT_JS_NAME), _REPORT_JS.encode('utf-8'))
+    # Each report depends only on its own files and its neighbours' paths,
+    # so pages are rendered and written concurrently.
+    n_reports = len(html_paths)
+    html_dirs = [os.path.dirname(html_path) for html_path in html_paths]
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as ex:
+        for _ in ex.map(lambda i: render_one(i, keys, html_paths, html_dirs, report_files, asset_dir, phase), range(n_reports)):
+            pass
 
-    <h2>Subject: {subject} | Session: {session} | Phase: {phase}</h2>
-
-    <div class="qc-buttons">
-        <button onclick="markQC('GOOD')">Mark Good</button>
-        <button onclick="markQC('BAD')">Mark Bad</button>
-        <button onclick="markQC('UNCLEAR')">Mark Unclear</button>
-        <span class="qc-status" id="qcStatusDisplay">Status: UNKNOWN</span>
-        <label for="qcNotes" style="margin-left: 20px;">Notes:</label>
-        <input type="text" id="qcNotes" style="width: 200px; margin-left: 5px; padding: 5px;" onchange="saveNotes()" placeholder="Add notes here..."/>
-    </div>
+    print("HTML reports generated successfully!")
 
-    <div class="section">
-        {orig_png}
-    </div>
+def numeric_order(sort_keys):
+    """
+    Indices that put the (sub_num, ses_num) pairs in ascending order, stable
+    like sorted(). Each pair is packed into one int64 so numpy does the sort;
+    numbers too large to pack fall back to sorted().
+    """
+    if sort_keys and max(k[0] for k in sort_keys) < 2**31 and max(k[1] for k in sort_keys) < 2**32:
+        packed = np.fromiter(((sub << 32) | ses for sub, ses in sort_keys),
+                             dtype=np.int64, count=len(sort_keys))
+        return np.argsort(packed, kind='stable').tolist()
+    return sorted(range(len(sort_keys)), key=sort_keys.__getitem__)
 
-    <div class="section">
-        {strip_png}
-    </div>
+def render_one(i, keys, html_paths, html_dirs, report_files, asset_dir, phase):
+    """
+    Build and write the i-th report. keys, html_paths and html_dirs are
+    parallel lists in report order; report_files holds the matching
+    (orig, strip, dens, stats) lists; asset_dir holds the shared CSS/JS.
+    Only reads its arguments, so it is safe to run from several threads.
+    """
+    subject, session = keys[i]
+    html_path = html_paths[i]
+    orig_file, strip_file, dens_file, stats_file = (files[i] for files in report_files)
+
+    # Build Prev/Next links
+    if i > 0:
+        prev_html = html_paths[i-1]
+        rel_prev = neighbour_href(prev_html, html_dirs[i-1], html_dirs[i])
+        prev_link = f'<a href="{rel_prev}">Previous</a>'
+    else:
+        prev_link = '<span style="color:gray;">Previous</span>'
+
+    if i < len(html_paths) - 1:
+        next_html = html_paths[i+1]
+        rel_next = neighbour_href(next_html, html_dirs[i+1], html_dirs[i])
+        next_link = f'<a href="{rel_next}">Next</a>'
+    else:
+        next_link = '<span style="color:gray;">Next</span>'
+
+    css_href = neighbour_href(os.path.join(asset_dir, REPORT_CSS_NAME), asset_dir, html_dirs[i])
+    js_href = neighbour_href(os.path.join(asset_dir, REPORT_JS_NAME), asset_dir, html_dirs[i])
+
+    if orig_file and strip_file and dens_file and stats_file:
+        # Usual case: every input present, image markup already in the template
+        html_content = _FULL_REPORT_TMPL.format(
+            subject=subject, session=session, phase=phase,
+            css_href=css_href, js_href=js_href,
+            prev_link=prev_link, next_link=next_link,
+            orig_name=orig_file[1], strip_name=strip_file[1],
+            dens_name=dens_file[1], stats_tbl=embed_stats(stats_file),
+        )
+    else:
+        # Prepare embedded blocks
+        orig_png  = embed_png(orig_file,  "Original Slices")       if orig_file  else not_found("Original Slices")
+        strip_png = embed_png(strip_file, "Skull-Stripped Slices") if strip_file else not_found("Skull-Stripped Slices")
+        dens_svg  = embed_svg(dens_file,  "Density Plot")          if dens_file  else not_found("Density Plot")
+        stats_tbl = embed_stats(stats_file)                        if stats_file else not_found("Stats")
 
-    <div class="section">
-        {dens_svg}
-    </div>
+        # Assemble HTML with annotation tool + Good/Bad classification
+        html_content = _REPORT_TMPL.format(
+            subject=subject, session=session, phase=phase,
+            css_href=css_href, js_href=js_href,
+            prev_link=prev_link, next_link=next_link,
+            orig_png=orig_png, strip_png=strip_png,
+            dens_svg=dens_svg, stats_tbl=stats_tbl,
+        )
 
-    <div class="section">
-        {stats_tbl}
-    </div>
+    write_bytes(html_path, html_content.encode('utf-8'))
 
-    <!-- Minimal annotation JavaScript snippet -->
-    <script>
-    // For each annotation container:
-    // We attach an event listener to the canvas to allow freehand drawing.
-    document.addEventListener('DOMContentLoaded', function() {{
-        const containers = document.querySelectorAll('.annotation-container');
-        containers.forEach(container => {{
-            const canvas = container.querySelector('.annot-canvas');
-            if (!canvas) return;
-
-            const ctx = canvas.getContext('2d');
-            let drawing = false;
-
-            function startDraw(e) {{
-                drawing = true;
-                ctx.beginPath();
-                ctx.moveTo(e.offsetX, e.offsetY);
-            }}
-            function draw(e) {{
-                if (!drawing) return;
-                ctx.lineWidth = 2;
-                ctx.lineCap = 'round';
-                ctx.strokeStyle = 'red';
-                ctx.lineTo(e.offsetX, e.offsetY);
-                ctx.stroke();
-            }}
-            function endDraw(e) {{
-                drawing = false;
-            }}
-
-            canvas.addEventListener('mousedown', startDraw);
-            canvas.addEventListener('mousemove', draw);
-            canvas.addEventListener('mouseup', endDraw);
-            canvas.addEventListener('mouseleave', endDraw);
-        }});
-
-        // On load, retrieve stored QC status and notes from localStorage
-        loadQCStatus();
-        loadNotes();
-    }});
-
-    // Store Good/Bad/Unclear decision in localStorage
-    function markQC(status) {{
-        const subject = "{subject}";
-        const session = "{session}";
-        const phase   = "{phase}";
-        const key = `QC_${{subject}}_${{session}}_${{phase}}`;
-        localStorage.setItem(key, status);
-        document.getElementById('qcStatusDisplay').innerHTML = `Status: ${{status}}`;
-        
-        // Save notes along with the status
-        saveNotes();
-    }}
-
-    // Save notes to localStorage
-    function saveNotes() {{
-        const subject = "{subject}";
-        const session = "{session}";
-        const phase   = "{phase}";
-        const notes = document.getElementById('qcNotes').value;
-        const notesKey = `QC_NOTES_${{subject}}_${{session}}_${{phase}}`;
-        localStorage.setItem(notesKey, notes);
-    }}
-
-    // On page load, display the previously selected QC status
-    function loadQCStatus() {{
-        const subject = "{subject}";
-        const session = "{session}";
-        const phase   = "{phase}";
-        const key = `QC_${{subject}}_${{session}}_${{phase}}`;
-        const storedValue = localStorage.getItem(key);
-        if (storedValue) {{
-            document.getElementById('qcStatusDisplay').innerHTML = `Status: ${{storedValue}}`;
-        }}
-    }}
-
-    // On page load, load any previously saved notes
-    function loadNotes() {{
-        const subject = "{subject}";
-        const session = "{session}";
-        const phase   = "{phase}";
-        const notesKey = `QC_NOTES_${{subject}}_${{session}}_${{phase}}`;
-        const storedNotes = localStorage.getItem(notesKey);
-        if (storedNotes) {{
-            document.getElementById('qcNotes').value = storedNotes;
-        }}
-    }}
-    </script>
+def neighbour_href(target_html, target_dir, source_dir):
+    """
+    Relative link from a report in source_dir to target_html (which lives in
+    target_dir). Neighbours in the same directory are just the file name.
+    """
+    if target_dir == source_dir:
+        return os.path.basename(target_html)
+    return _relpath(target_html, source_dir)
 
-</body>
-</html>"""
+def _relpath(target, start_dir):
+    """
+    os.path.relpath for paths built from the same root_dir spelling: drop the
+    shared leading components and climb out of the rest with '..', without
+    abspath/normpath. Anything that would need normalising (empty, '.' or '..'
+    components, alternate separators, no shared prefix) goes to os.path.relpath.
+    """
+    if os.altsep and (os.altsep in target or os.altsep in start_dir):
+        return os.path.relpath(target, start_dir)
+    t_parts = target.split(os.sep)
+    s_parts = start_dir.split(os.sep)
+    common = 0
+    limit = min(len(t_parts) - 1, len(s_parts))
+    while common < limit and t_parts[common] == s_parts[common]:
+        common += 1
+    up = s_parts[common:]
+    down = t_parts[common:]
+    if not common or any(p in ('', '.', '..') for p in up + down):
+        return os.path.relpath(target, start_dir)
+    return os.sep.join(['..'] * len(up) + down)
+
+# Raw-fd flags for write_bytes; O_BINARY only exists (and matters) on Windows
+_WRITE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+
+def write_bytes(path, data):
+    """
+    Write pre-encoded bytes to path through a raw fd (no io buffering or
+    text layer). Loops in case the OS accepts a partial write.
+    """
+    fd = os.open(path, _WRITE_FLAGS, 0o666)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
 
-        with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+def parse_sub_ses(name):
+    """
+    Find the first 'sub-<digits>' in name and an optional 'ses-<digits>'
+    right after it (one '_' allowed in between). Returns (subject, session),
+    with session defaulting to 'ses-01', or None if there is no subject.
+    """
+    n = len(name)
+    i = name.find('sub-')
+    while i != -1:
+        end = i + 4
+        while end < n and name[end].isdecimal():
+            end += 1
+        if end > i + 4:
+            break
+        i = name.find('sub-', i + 1)
+    if i == -1:
+        return None
+    subject = name[i:end]
+
+    session = 'ses-01'
+    if end < n and name[end] == '_':
+        end += 1
+    if name.startswith('ses-', end):
+        ses_end = end + 4
+        while ses_end < n and name[ses_end].isdecimal():
+            ses_end += 1
+        if ses_end > end + 4:
+            session = name[end:ses_end]
+    return subject, session
+
+# Report input suffix (text after the '_' that precedes it) -> slot in the
+# (orig, strip, dens, stats) tuple returned by match_report_files.
+SUFFIX_MAP = {
+    'original_slices.png': 0,
+    'skullstripped_slices.png': 1,
+    'density.svg': 2,
+    'stats.csv': 3,
+}
+
+def match_report_files(entries):
+    """
+    Pick out the four report inputs from one directory's file entries.
+    Returns (orig, strip, dens, stats) as (full path, file name) pairs,
+    None where absent. The first match for each kind is kept, and the scan
+    stops as soon as all four are found.
+    """
+    found = [None, None, None, None]
+    missing = len(found)
+
+    for entry in entries:
+        fname = entry.name
+        cut = fname.rfind('_')
+        if cut < 0:
+            continue
+        tail = fname[cut + 1:]
+        if tail == 'slices.png':
+            # Both PNG suffixes carry one more '_'; step back to it
+            cut = fname.rfind('_', 0, cut)
+            if cut < 0:
+                continue
+            tail = fname[cut + 1:]
+        slot = SUFFIX_MAP.get(tail)
+        if slot is not None and found[slot] is None:
+            found[slot] = (entry.path, fname)
+            missing -= 1
+            if not missing:
+                break
+
+    return tuple(found)
+
+def scan_tree(top):
+    """
+    Scan one subtree; returns a (dirpath, orig, strip, dens, stats) record
+    per directory, in walk order. Runs in a worker thread and shares no state.
+    """
+    return [(dirpath,) + match_report_files(entries) for dirpath, entries in iter_dirs(top)]
 
-    print("HTML reports generated successfully!")
+# Directory names never descended into (BIDS non-subject trees); names
+# starting with '.' are skipped as well.
+SKIP_DIRS = {'derivatives', 'sourcedata', 'code'}
 
-def embed_png(png_path, title="Image"):
+def iter_dirs(root):
+    """
+    Yield (dirpath, file_entries) for root and every directory below it, in
+    the same top-down order as os.walk. Uses os.scandir so each entry's type
+    comes from the directory listing instead of a separate stat call.
+    Symlinked directories are not followed, and unreadable directories are
+    skipped, as with os.walk. Hidden and SKIP_DIRS directories are pruned.
+    """
+    stack = [root]
+    while stack:
+        dirpath = stack.pop()
+        subdirs = []
+        files = []
+        try:
+            with os.scandir(dirpath) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        name = entry.name
+                        if not (name.startswith('.') or name in SKIP_DIRS or entry.is_symlink()):
+                            subdirs.append(entry.path)
+                    else:
+                        files.append(entry)
+        except OSError:
+            continue
+        yield dirpath, files
+        # Reversed so the first subdirectory is popped (visited) first
+        stack.extend(reversed(subdirs))
+
+def embed_png(png_file, title="Image"):
     """
     Return an HTML snippet that displays the PNG with a canvas overlay for annotations.
+    png_file is a (full path, file name) pair from the walk.
     """
-    if not png_path:
+    if not png_file:
         return not_found(title)
-    fname = os.path.basename(png_path)
+    fname = png_file[1]
     return f"""
     <h3>{title}</h3>
     <div class="annotation-container">
         <img class="png-image" src="{fname}" onload="resizeCanvas(this)" />
         <canvas class="annot-canvas"></canvas>
     </div>
-    <script>
-    // Resize the canvas to match the image dimensions
-    function resizeCanvas(imgElem) {{
-        let canvas = imgElem.parentNode.querySelector('.annot-canvas');
-        if (canvas) {{
-            canvas.width = imgElem.width;
-            canvas.height = imgElem.height;
-        }}
-    }}
-    </script>
     """
 
-def embed_svg(svg_path, title="Image"):
+def embed_svg(svg_file, title="Image"):
     """
     Return an HTML snippet that displays the SVG with a canvas overlay for annotations.
+    svg_file is a (full path, file name) pair from the walk.
     """
-    if not svg_path:
+    if not svg_file:
         return not_found(title)
-    fname = os.path.basename(svg_path)
+    fname = svg_file[1]
     return f"""
     <h3>{title}</h3>
     <div class="annotation-container">
@@ -361,46 +616,34 @@ def embed_svg(svg_path, title="Image"):
         <object class="svg-image" type="image/svg+xml" data="{fname}" onload="resizeSvgCanvas(this)"></object>
         <canvas class="annot-canvas"></canvas>
     </div>
-    <script>
-    // Rough approach to resizing the canvas after the SVG loads
-    function resizeSvgCanvas(objElem) {{
-        let canvas = objElem.parentNode.querySelector('.annot-canvas');
-        if (canvas) {{
-            // We can't easily get the rendered width/height of an <object> with an SVG,
-            // so you might want a more robust approach or fixed size.
-            canvas.width = 600;
-            canvas.height = 400;
-        }}
-    }}
-    </script>
     """
 
+# _REPORT_TMPL with the image blocks filled in ahead of time, for reports
+# that have all four inputs; only the file names and stats table remain.
+_FULL_REPORT_TMPL = _REPORT_TMPL.replace(
+    "{orig_png}", embed_png((None, "{orig_name}"), "Original Slices")).replace(
+    "{strip_png}", embed_png((None, "{strip_name}"), "Skull-Stripped Slices")).replace(
+    "{dens_svg}", embed_svg((None, "{dens_name}"), "Density Plot"))
+
 def not_found(title="Item"):
     """
     Return a simple HTML snippet indicating a missing file.
     """
     return f"<h3>{title}</h3><p style='color:red;'>No file found.</p>"
 
-def embed_stats(csv_path):
+def embed_stats(csv_file):
     """
     Reads a CSV expecting columns: mean, median, max, min, std
     on a single line (or second line if first line is header).
-    Produces a small HTML table.
+    Produces a small HTML table. csv_file is a (full path, file name) pair.
     """
-    if not csv_path:
+    if not csv_file:
         return not_found("Stats")
-    fname = os.path.basename(csv_path)
+    csv_path, fname = csv_file
     headers = ["mean", "median", "max", "min", "std"]
 
     try:
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            lines = [line.strip() for line in f if line.strip()]
-            if len(lines) >= 2 and all_numeric(lines[1].split(',')):
-                data_line = lines[1]
-            else:
-                data_line = lines[0]
-
-            values = data_line.split(',')
+        values = _read_stats(csv_path, os.stat(csv_path).st_mtime_ns)
     except Exception as e:
         return f"<h3>Stats</h3><p>Unable to read CSV: {e}</p>"
 
@@ -421,13 +664,31 @@ def embed_stats(csv_path):
     """
     return table_html
 
+@lru_cache(maxsize=4096)
+def _read_stats(csv_path, mtime_ns):
+    """
+    Values row of a stats CSV as a tuple. mtime_ns is only part of the cache
+    key, so an edited file is read again.
+    """
+    # Only the first two non-blank rows matter (header, values)
+    rows = []
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if any(cell.strip() for cell in row):
+                rows.append(row)
+                if len(rows) == 2:
+                    break
+    if len(rows) >= 2 and all_numeric(rows[1]):
+        return tuple(rows[1])
+    return tuple(rows[0])
+
 def all_numeric(vals):
     """
     Helper to check if every item in `vals` can be cast to float.
     """
     try:
-        for v in vals:
-            float(v)
+        # list() forces every conversion; any()/all() would stop early
+        list(map(float, vals))
         return True
     except ValueError:
         return False
\ No newline at end of file